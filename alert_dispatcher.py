@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+import discord
+
+# Discord caps embed descriptions at 4096 characters
+EMBED_DESCRIPTION_LIMIT = 4096
+MIN_DIGEST_PART = 200  # Shortest excerpt of an alert worth adding to a digest
+
+logger = logging.getLogger('discord_bot')
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at a fixed rate"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate            # Tokens added per second
+        self.capacity = capacity    # Maximum burst size
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0    # Set when Discord tells us to back off
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now=None):
+        """Seconds until a token is available"""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        if self.blocked_until > now:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, now=None):
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, seconds):
+        """Refuse tokens for the next `seconds` seconds"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+
+class AlertDispatcher:
+    """Background sender with per-channel and global token buckets that coalesces bursts into digests"""
+
+    def __init__(self, channel_rate=1.0, channel_burst=1, global_rate=40.0, global_burst=40, max_attempts=3,
+                 wait_histogram=None):
+        self.channel_rate = channel_rate
+        self.channel_burst = channel_burst
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.max_attempts = max_attempts  # Sends per digest before giving up on 429s
+        self.wait_histogram = wait_histogram  # Optional histogram of enqueue-to-send delay
+
+        self._buckets = {}        # channel_id -> TokenBucket
+        self._pending = {}        # channel_id -> (channel, list of alerts)
+        self._ready = deque()     # channel ids with pending alerts, in arrival order
+        self._attempts = {}       # channel_id -> failed attempts for the pending digest
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._sends = set()
+
+        self.stats = {
+            'alerts': 0,
+            'sent': 0,
+            'digests': 0,
+            'rate_limited': 0,
+            'dropped': 0,
+        }
+
+    def start(self):
+        """Start the dispatcher task on the running loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop dispatching and wait for in-progress sends"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._sends:
+            await asyncio.gather(*self._sends, return_exceptions=True)
+
+    def enqueue(self, channel, content=None, embed=None):
+        """Queue an alert for a channel without waiting on rate limits"""
+        self.stats['alerts'] += 1
+        if channel.id not in self._pending:
+            self._pending[channel.id] = (channel, [])
+            self._ready.append(channel.id)
+        self._pending[channel.id][1].append((content, embed, time.monotonic()))
+        self._wakeup.set()
+
+    def drop_channel(self, channel_id):
+        """Forget pending alerts and rate state for a channel"""
+        pending = self._pending.pop(channel_id, None)
+        if pending is not None:
+            self.stats['dropped'] += len(pending[1])
+            try:
+                self._ready.remove(channel_id)
+            except ValueError:
+                pass
+        self._buckets.pop(channel_id, None)
+        self._attempts.pop(channel_id, None)
+
+    def _bucket(self, channel_id):
+        bucket = self._buckets.get(channel_id)
+        if bucket is None:
+            bucket = self._buckets[channel_id] = TokenBucket(self.channel_rate, self.channel_burst)
+        return bucket
+
+    async def _run(self):
+        while True:
+            if not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            wait = self.global_bucket.wait_time(now)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            # Find the first channel in arrival order whose bucket has a token
+            channel_id = None
+            min_wait = None
+            for _ in range(len(self._ready)):
+                candidate = self._ready[0]
+                candidate_wait = self._bucket(candidate).wait_time(now)
+                if candidate_wait <= 0:
+                    channel_id = candidate
+                    break
+                min_wait = candidate_wait if min_wait is None else min(min_wait, candidate_wait)
+                self._ready.rotate(-1)
+
+            if channel_id is None:
+                # Alerts that arrive while we wait are coalesced into the next digest
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), min_wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._ready.popleft()
+            channel, alerts = self._pending.pop(channel_id)
+            self._bucket(channel_id).consume(now)
+            self.global_bucket.consume(now)
+
+            task = asyncio.create_task(self._send(channel, alerts))
+            self._sends.add(task)
+            task.add_done_callback(self._sends.discard)
+
+    async def _send(self, channel, alerts):
+        """Send one alert, or a digest of several, handling 429s by requeueing"""
+        try:
+            if len(alerts) == 1:
+                content, embed, _ = alerts[0]
+                await channel.send(content=content, embed=embed)
+            else:
+                self.stats['digests'] += 1
+                await channel.send(embed=self._digest(alerts))
+            self.stats['sent'] += len(alerts)
+            if self.wait_histogram is not None:
+                now = time.monotonic()
+                for _, _, enqueued_at in alerts:
+                    self.wait_histogram.observe(now - enqueued_at)
+            self._attempts.pop(channel.id, None)
+        except discord.errors.HTTPException as e:
+            if e.status != 429:
+                logger.error("Error sending alerts to channel %s: %s", channel.id, e)
+                self.stats['dropped'] += len(alerts)
+                return
+            self.stats['rate_limited'] += 1
+            attempts = self._attempts.get(channel.id, 0) + 1
+            if attempts >= self.max_attempts:
+                logger.warning("Dropping %d alerts for channel %s after %d rate-limited attempts", len(alerts), channel.id, attempts)
+                self.stats['dropped'] += len(alerts)
+                self._attempts.pop(channel.id, None)
+                return
+            self._attempts[channel.id] = attempts
+
+            # Back off this channel and put the alerts back in front of anything newer
+            retry_after = getattr(e, 'retry_after', None) or 5
+            self._bucket(channel.id).block(retry_after)
+            if channel.id in self._pending:
+                self._pending[channel.id][1][:0] = alerts
+            else:
+                self._pending[channel.id] = (channel, list(alerts))
+                self._ready.appendleft(channel.id)
+            self._wakeup.set()
+        except Exception:
+            logger.exception("Error sending alerts to channel %s", channel.id)
+            self.stats['dropped'] += len(alerts)
+
+    def _digest(self, alerts):
+        """Merge several pending alerts into one embed, shortening the longest ones to fit"""
+        entries = []
+        for content, embed, _ in alerts:
+            text = embed.description if embed is not None and embed.description else content or ''
+            footer = f"\n*{embed.footer.text}*" if embed is not None and embed.footer and embed.footer.text else ''
+            entries.append((text, footer))
+
+        # Leave room for the "more" line; keep alerts in order while each still gets a useful excerpt
+        budget = EMBED_DESCRIPTION_LIMIT - 40
+        kept = reserved = 0
+        for text, footer in entries:
+            needed = min(len(text) + len(footer), MIN_DIGEST_PART) + 2
+            if kept and reserved + needed > budget:
+                break
+            kept += 1
+            reserved += needed
+        entries = entries[:kept]
+
+        # Short alerts keep their full text and the longest ones share what is left
+        room = budget - 2 * (kept - 1)
+        limits = [0] * kept
+        by_length = sorted(range(kept), key=lambda i: len(entries[i][0]) + len(entries[i][1]))
+        for n, i in enumerate(by_length):
+            limits[i] = min(len(entries[i][0]) + len(entries[i][1]), room // (kept - n))
+            room -= limits[i]
+
+        parts = []
+        for (text, footer), limit in zip(entries, limits):
+            if len(text) + len(footer) > limit:
+                # Cut the alert body, keeping the footer that says who posted it
+                text = (text[:max(limit - len(footer) - 1, 0)] + "…" + footer)[:limit]
+                footer = ''
+            parts.append(text + footer)
+
+        description = "\n\n".join(parts)
+        if len(parts) < len(alerts):
+            description += f"\n\n…and {len(alerts) - len(parts)} more"
+
+        return discord.Embed(
+            title=f"Toxicity Alerts ({len(alerts)})",
+            description=description,
+            color=discord.Color.red()
+        )
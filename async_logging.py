@@ -0,0 +1,68 @@
+import json
+import logging
+import logging.handlers
+import queue
+import random
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Format records as compact one-line JSON objects"""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and key != 'sampled':
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, separators=(',', ':'), default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of per-message records (logged with extra={'sampled': True})"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        # Warnings and errors are never sampled away
+        if not getattr(record, 'sampled', False) or record.levelno >= logging.WARNING:
+            return True
+        return random.random() < self.rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records instead of blocking or erroring when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_async_logging(logger, handlers, sample_rate=1.0, max_queue=10000):
+    """Route logger through a queue so handlers write from a background thread
+
+    Returns the started QueueListener; call stop() on shutdown to flush it.
+    """
+    log_queue = queue.Queue(max_queue)
+    queue_handler = DroppingQueueHandler(log_queue)
+    logger.addFilter(SamplingFilter(sample_rate))
+    logger.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
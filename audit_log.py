@@ -0,0 +1,136 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger('discord_bot')
+
+
+class AuditLog:
+    """Append-only SQLite log of flagged verdicts, written in batches by a background task"""
+
+    def __init__(self, path='audit_log.db', flush_interval=2.0, batch_size=500, max_pending=10000):
+        self.path = path
+        self.flush_interval = flush_interval  # Seconds between background writes
+        self.batch_size = batch_size          # Write early once this many records are pending
+        self.max_pending = max_pending        # Records kept in memory if the disk falls behind
+
+        self._pending = deque()
+        self._full = asyncio.Event()
+        self._task = None
+        self._lock = threading.Lock()
+
+        self.stats = {
+            'recorded': 0,
+            'written': 0,
+            'dropped': 0,
+        }
+
+        self._db = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS flags ("
+            "id INTEGER PRIMARY KEY, flagged_at REAL NOT NULL, guild_id INTEGER NOT NULL, "
+            "channel_id INTEGER NOT NULL, message_id INTEGER NOT NULL, author_id INTEGER NOT NULL, "
+            "author_name TEXT, max_category TEXT, max_score REAL, category_scores TEXT, outcome TEXT)"
+        )
+        # Secondary indexes for !history by user, by channel and by time
+        self._db.execute("CREATE INDEX IF NOT EXISTS flags_by_user ON flags (guild_id, author_id, flagged_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS flags_by_channel ON flags (channel_id, flagged_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS flags_by_time ON flags (flagged_at)")
+        self._db.commit()
+
+    def record(self, message, result, outcome, now=None):
+        """Queue a flagged verdict; never touches the disk"""
+        self.stats['recorded'] += 1
+        if len(self._pending) >= self.max_pending:
+            self._pending.popleft()
+            self.stats['dropped'] += 1
+        self._pending.append((
+            time.time() if now is None else now,
+            message.guild.id if message.guild else 0,
+            message.channel.id,
+            message.id,
+            message.author.id,
+            message.author.name,
+            result['max_category'],
+            round(result['max_score'], 4),
+            json.dumps({category: round(score, 4) for category, score in result['category_scores'].items()}),
+            outcome,
+        ))
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+
+    def start(self):
+        """Start the background writer on the running loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Append every pending record in a single transaction off the event loop"""
+        if not self._pending:
+            return
+        batch = list(self._pending)
+        self._pending.clear()
+        try:
+            await asyncio.to_thread(self._write, batch)
+            self.stats['written'] += len(batch)
+        except Exception:
+            logger.exception("Error writing audit log")
+            # Retry on the next flush, keeping the newest records if the buffer has refilled meanwhile
+            room = max(self.max_pending - len(self._pending), 0)
+            if room:
+                self._pending.extendleft(reversed(batch[-room:]))
+            self.stats['dropped'] += len(batch) - min(room, len(batch))
+
+    def _write(self, batch):
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT INTO flags (flagged_at, guild_id, channel_id, message_id, author_id, author_name, "
+                "max_category, max_score, category_scores, outcome) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                batch
+            )
+
+    async def by_user(self, guild_id, author_id, since=None, limit=20):
+        """Newest flagged records for a user in a guild"""
+        return await asyncio.to_thread(
+            self._query, "guild_id = ? AND author_id = ?", (guild_id, author_id), since, limit
+        )
+
+    async def by_channel(self, channel_id, since=None, limit=20):
+        """Newest flagged records in a channel"""
+        return await asyncio.to_thread(self._query, "channel_id = ?", (channel_id,), since, limit)
+
+    def _query(self, where, params, since, limit):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT flagged_at, guild_id, channel_id, message_id, author_id, author_name, "
+                "max_category, max_score, category_scores, outcome "
+                f"FROM flags WHERE {where} AND flagged_at >= ? ORDER BY flagged_at DESC LIMIT ?",
+                (*params, since or 0.0, limit)
+            ).fetchall()
+        keys = ('flagged_at', 'guild_id', 'channel_id', 'message_id', 'author_id', 'author_name',
+                'max_category', 'max_score', 'category_scores', 'outcome')
+        return [dict(zip(keys, row), category_scores=json.loads(row[8])) for row in rows]
+
+    async def close(self):
+        """Stop the writer, write what is pending and close the database"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        self._db.close()
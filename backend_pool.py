@@ -0,0 +1,187 @@
+import asyncio
+import functools
+import itertools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger('discord_bot')
+
+# Circuit breaker states
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the backend while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Open after consecutive failures, fail fast for a cooldown, then let one probe through"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def check(self):
+        """Raise CircuitOpenError if a call should not be attempted now"""
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError("Backend circuit is open")
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._probe_in_flight:
+                raise CircuitOpenError("Backend circuit is half-open; probe in flight")
+            self._probe_in_flight = True
+
+    def record_success(self):
+        self.failures = 0
+        self._probe_in_flight = False
+        if self.state != CLOSED:
+            self._transition(CLOSED)
+
+    def record_cancelled(self):
+        """A call was cancelled before it finished: no signal about the backend, but free the probe slot"""
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            if self.state != OPEN:
+                self._transition(OPEN)
+
+    def _transition(self, state):
+        logger.warning("Backend circuit breaker %s -> %s", self.state, state)
+        self.state = state
+
+
+class BackendPool:
+    """Pool of Gradio clients on a dedicated executor with deadlines, hedging and a circuit breaker"""
+
+    def __init__(self, client_factory, size=2, threads=8, timeout=10.0, hedge_delay=None, breaker=None):
+        self.client_factory = client_factory  # Called in the executor to build each client
+        self.size = size
+        self.timeout = timeout          # Overall deadline per prediction, hedges included
+        self.hedge_delay = hedge_delay  # Seconds before a second request is sent, or None to disable
+        self.breaker = breaker or CircuitBreaker()
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='gradio')
+        self.clients = []               # Created lazily by connect()
+        self.connect_seconds = None
+        self._next_client = None
+        self._connecting = None
+
+        self.stats = {
+            'calls': 0,
+            'hedged': 0,
+            'hedge_wins': 0,
+            'timeouts': 0,
+            'rejected': 0,
+        }
+
+    async def connect(self):
+        """Create the clients once; concurrent callers share a single attempt and failures are retried"""
+        if self.clients:
+            return
+        if self._connecting is None or (self._connecting.done() and self._connecting.exception()):
+            self._connecting = asyncio.ensure_future(self._connect())
+        await asyncio.shield(self._connecting)
+
+    async def _connect(self):
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        clients = await asyncio.gather(*(
+            loop.run_in_executor(self.executor, self.client_factory) for _ in range(self.size)
+        ))
+        self.clients = list(clients)
+        self._next_client = itertools.cycle(self.clients)
+        self.connect_seconds = time.perf_counter() - start
+        logger.info("Connected %d backend clients in %.2fs", len(self.clients), self.connect_seconds)
+
+    @property
+    def degraded(self):
+        """True while the breaker is not letting normal traffic through"""
+        return self.breaker.state != CLOSED
+
+    async def predict(self, *args, **kwargs):
+        """Run client.predict(*args, **kwargs) under the deadline, hedge and breaker policies"""
+        try:
+            self.breaker.check()
+        except CircuitOpenError:
+            self.stats['rejected'] += 1
+            raise
+
+        try:
+            # Connecting counts against the same deadline as the call itself
+            deadline = time.monotonic() + self.timeout
+            if not self.clients:
+                try:
+                    await asyncio.wait_for(self.connect(), self.timeout)
+                except asyncio.TimeoutError:
+                    self.stats['timeouts'] += 1
+                    raise
+            result = await self._hedged(args, kwargs, deadline - time.monotonic())
+        except asyncio.CancelledError:
+            self.breaker.record_cancelled()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return result
+
+    async def _hedged(self, args, kwargs, timeout):
+        first = asyncio.ensure_future(self._call(args, kwargs))
+        if self.hedge_delay is None or self.hedge_delay >= timeout or self.size < 2:
+            try:
+                return await asyncio.wait_for(first, timeout)
+            except asyncio.TimeoutError:
+                self.stats['timeouts'] += 1
+                raise
+
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_delay)
+        if done:
+            return first.result()
+
+        # The first request is slow: race a second one on another client
+        self.stats['hedged'] += 1
+        second = asyncio.ensure_future(self._call(args, kwargs))
+        pending = {first, second}
+        deadline = time.monotonic() + timeout - self.hedge_delay
+        error = None
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    if task is second:
+                        self.stats['hedge_wins'] += 1
+                    return task.result()
+                error = task.exception()
+
+        for task in pending:
+            task.cancel()
+        if error is not None and not pending:
+            raise error
+        self.stats['timeouts'] += 1
+        raise asyncio.TimeoutError("Backend call exceeded its deadline")
+
+    async def _call(self, args, kwargs):
+        self.stats['calls'] += 1
+        client = next(self._next_client)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(client.predict, *args, **kwargs))
+
+    def close(self):
+        """Stop the executor without waiting for calls that already missed their deadline"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,61 @@
+import asyncio
+
+from verdict_cache import cache_key
+
+
+class RequestCoalescer:
+    """Share one backend call between concurrent requests for the same text, under a concurrency cap
+
+    The moderation endpoint scores one text per call, so there is nothing to
+    gain from waiting for a batch to fill: requests are dispatched immediately
+    and only coalesced with an identical (normalized) text already in flight.
+    """
+
+    def __init__(self, score_func, max_in_flight=4):
+        self.score_func = score_func          # Coroutine function: text -> result dict
+        self.max_in_flight = max_in_flight    # Cap on concurrent backend calls
+
+        self._semaphore = None
+        self._in_flight = {}                  # cache key -> task scoring that text
+
+        self.stats = {
+            'requests': 0,
+            'backend_calls': 0,
+            'deduplicated': 0,
+        }
+
+    def start(self):
+        """Create the concurrency cap on the running loop"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+    async def stop(self):
+        """Let running backend calls finish so their waiters get a result"""
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight.values(), return_exceptions=True)
+
+    async def submit(self, text):
+        """Score text, joining an identical request that is already in flight"""
+        self.start()
+        self.stats['requests'] += 1
+        key = cache_key(text)
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._score(text))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.stats['deduplicated'] += 1
+        # Shielded so one cancelled waiter doesn't cancel the call for the others
+        result = await asyncio.shield(task)
+        return dict(result)  # Give each waiter its own copy so callers can't mutate each other's result
+
+    def _finished(self, key, task):
+        self._in_flight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # Retrieved here in case every waiter was cancelled
+
+    async def _score(self, text):
+        async with self._semaphore:
+            self.stats['backend_calls'] += 1
+            return await self.score_func(text)
@@ -0,0 +1,357 @@
+"""Offline replay benchmark for ToxicityBot.on_message
+
+Replays a JSONL message corpus into on_message at a fixed rate, using fake
+Discord messages/channels and a local stand-in for gradio_client.Client.predict,
+then reports throughput, verdict latency percentiles, memory growth and
+backend call counts.
+
+    python bench/replay.py --rate 200 --latency-ms 300 --error-rate 0.02
+
+bench/corpus.jsonl is mostly distinct chat (regenerate it with --generate);
+bench/corpus_raid.jsonl replays a raid-heavy scenario dominated by copies.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import discord
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# Words the fake backend treats as insults, so flag rates look plausible
+TOXIC_WORDS = ('idiot', 'loser', 'moron', 'pathetic', 'worthless', 'dumbest', 'clown', 'shut up')
+CATEGORIES = ('harassment', 'hate', 'insult', 'self-harm', 'sexual', 'violence')
+
+# Vocabulary for --generate: sentences are assembled from these at random
+OPENERS = ('honestly', 'ok so', 'lol', 'wait', 'btw', 'yeah', 'hmm', 'not gonna lie', 'fr', 'anyway')
+SUBJECTS = ('the new patch', 'my build', 'the raid last night', 'this server', 'the stream', 'your deck',
+            'the beta', 'that boss fight', 'the tournament', 'my internet', 'the mod team', 'the update',
+            'the event schedule', 'the soundtrack', 'ranked queue', 'the art channel', 'my team', 'the map')
+VERBS = ('is', 'was', 'seems', 'looks', 'feels', 'got', 'turned out', 'keeps being', 'might be', 'ended up')
+COMPLEMENTS = ('way better than expected', 'kind of broken', 'really fun', 'slower than before', 'a mess',
+               'pretty solid', 'so confusing', 'underrated', 'too grindy', 'worth trying', 'finally fixed',
+               'weirdly addictive', 'laggy again', 'actually balanced', 'overpriced', 'a nice surprise')
+FOLLOW_UPS = ('anyone else notice?', 'thoughts?', 'going to try again tomorrow.', 'see you all at 8.',
+              'thanks for the tips earlier!', 'what are you running?', 'I might stream it later.',
+              'need two more for a group.', 'check the pins for details.', 'gg everyone.')
+INSULTS = ('you idiot', 'what a loser', 'absolute moron', 'pathetic', 'you are worthless',
+           'dumbest take ever', 'shut up clown')
+
+
+def generate_corpus(count, seed=0, toxic_rate=0.1, repeat_rate=0.05, long_rate=0.02):
+    """Mostly distinct chat lines, with a few insults, exact repeats and long messages"""
+    rng = random.Random(seed)
+    records = []
+    for _ in range(count):
+        if records and rng.random() < repeat_rate:
+            text = rng.choice(records)['text']  # Short replies like "gg" get repeated in real chat
+        else:
+            sentences = []
+            for _ in range(rng.randint(1, 3)):
+                sentence = f"{rng.choice(SUBJECTS)} {rng.choice(VERBS)} {rng.choice(COMPLEMENTS)}"
+                if rng.random() < 0.4:
+                    sentence = f"{rng.choice(OPENERS)} {sentence}"
+                if rng.random() < 0.3:
+                    sentence = f"{sentence}, {rng.choice(FOLLOW_UPS)}"
+                sentences.append(sentence[0].upper() + sentence[1:] + ('' if sentence[-1] in '.?!' else '.'))
+            if rng.random() < long_rate:
+                sentences *= rng.randint(8, 15)  # Long enough to be scored in segments
+            if rng.random() < toxic_rate:
+                sentences.insert(rng.randrange(len(sentences) + 1), rng.choice(INSULTS).capitalize() + '.')
+            text = " ".join(sentences)
+        records.append({'text': text, 'guild': rng.randint(1, 3), 'channel': rng.randint(1, 3),
+                        'author': rng.randint(1, 200)})
+    return records
+
+
+class FakeGradioClient:
+    """Stand-in for gradio_client.Client with configurable latency and error distributions"""
+
+    def __init__(self, latency_ms=250.0, latency_sigma=0.5, error_rate=0.0, timeout_rate=0.0, timeout_s=10.0, seed=0):
+        self.latency_ms = latency_ms        # Median call latency
+        self.latency_sigma = latency_sigma  # Log-normal spread of latency
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_s = timeout_s
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    def predict(self, text, threshold, endpoint, api_name=None):
+        with self._lock:
+            self.calls += 1
+            roll = self._random.random()
+            latency = self.latency_ms / 1000 * math.exp(self._random.gauss(0, self.latency_sigma))
+
+        if roll < self.timeout_rate:
+            with self._lock:
+                self.timeouts += 1
+            time.sleep(self.timeout_s)
+            raise TimeoutError("Fake backend timed out")
+
+        time.sleep(latency)
+        if roll < self.timeout_rate + self.error_rate:
+            with self._lock:
+                self.errors += 1
+            raise ConnectionError("Fake backend error")
+
+        return (None, json.dumps(self._score(text, threshold)))
+
+    def _score(self, text, threshold):
+        """Deterministic scores shaped like the /fetch_toxicity_level response"""
+        digest = hashlib.sha1(text.encode('utf-8')).digest()
+        lowered = text.lower()
+        boost = 0.6 if any(word in lowered for word in TOXIC_WORDS) else 0.0
+        scores = {
+            category: round(min(1.0, digest[i] / 255 * 0.15 + (boost if category in ('harassment', 'insult') else 0.0)), 4)
+            for i, category in enumerate(CATEGORIES)
+        }
+        max_key = max(scores, key=scores.get)
+        return dict(
+            scores,
+            max_key=max_key,
+            max_value=scores[max_key],
+            sum_value=round(sum(scores.values()), 4),
+            safer_value=threshold,
+            is_flagged=scores[max_key] > threshold,
+            is_safer_flagged=scores[max_key] > threshold,
+        )
+
+
+class FakeAuthor:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.name = f"user{user_id}"
+        self.mention = f"<@{user_id}>"
+        # Marked as a bot so process_commands returns without a gateway connection
+        self.bot = True
+
+
+class FakeGuild:
+    def __init__(self, guild_id):
+        self.id = guild_id
+
+
+class FakeChannel:
+    """Records what the bot sends instead of calling Discord"""
+
+    def __init__(self, channel_id, guild):
+        self.id = channel_id
+        self.guild = guild
+        self.sent = 0
+
+    async def send(self, content=None, embed=None):
+        self.sent += 1
+
+
+class FakeMessage:
+    def __init__(self, message_id, content, channel, author):
+        self.id = message_id
+        self.content = content
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.created_at = discord.utils.utcnow()
+        self.edited_at = None
+        self.attachments = []
+        self.embeds = []
+
+
+def load_corpus(path):
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def replay(args):
+    from bot import ToxicityBot
+
+    backend = FakeGradioClient(
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        timeout_rate=args.timeout_rate,
+        seed=args.seed,
+    )
+    bot = ToxicityBot(client=backend)
+
+    corpus = load_corpus(args.corpus)
+    guilds = {}
+    channels = {}
+    for record in corpus:
+        guild_id = record.get('guild', 1)
+        channel_id = guild_id * 1000 + record.get('channel', 1)
+        guild = guilds.setdefault(guild_id, FakeGuild(guild_id))
+        channels.setdefault(channel_id, FakeChannel(channel_id, guild))
+    for channel_id in channels:
+        bot.channel_store.add(channel_id)
+
+    # Time every message from hand-off to verdict
+    latencies = []
+    in_progress = 0
+    enqueued_at = {}
+    process_message = bot._process_message
+    analyze_message = bot.analyze_message
+    scored = set()  # Ids of queued messages that reached scoring (the rest expired in the queue)
+
+    async def tracked_analyze(message):
+        scored.add(message.id)
+        return await analyze_message(message)
+
+    async def timed_process(message):
+        nonlocal in_progress
+        in_progress += 1
+        try:
+            await process_message(message)
+        finally:
+            in_progress -= 1
+            started = enqueued_at.pop(message.id)
+            if message.id in scored:
+                scored.discard(message.id)
+                latencies.append(time.perf_counter() - started)
+
+    bot.analyze_message = tracked_analyze
+
+    bot.scoring_workers.handler = timed_process
+
+    # Copies held by the burst detector get their verdict when the burst window closes
+    handle_burst = bot._handle_burst
+
+    async def timed_burst(cluster):
+        await handle_burst(cluster)
+        now = time.perf_counter()
+        for message in cluster.duplicates:
+            if message.id in enqueued_at:
+                latencies.append(now - enqueued_at.pop(message.id))
+
+    bot._handle_burst = timed_burst
+    await bot.setup_hook()
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if args.tracemalloc:
+        tracemalloc.start()
+    start = time.perf_counter()
+
+    # Replay at a fixed rate, correcting for drift
+    interval = 1.0 / args.rate
+    message_id = 0
+    for _ in range(args.repeat):
+        for record in corpus:
+            message_id += 1
+            guild_id = record.get('guild', 1)
+            channel = channels[guild_id * 1000 + record.get('channel', 1)]
+            author = FakeAuthor(record.get('author', message_id % 50))
+            message = FakeMessage(message_id, record['text'], channel, author)
+            enqueued_at[message.id] = time.perf_counter()
+            held = bot.bursts.stats['duplicates']
+            await bot.on_message(message)
+            if (channel.id, message.id) not in bot.message_cooldown and bot.bursts.stats['duplicates'] == held:
+                enqueued_at.pop(message.id, None)  # Skipped or shed before queueing
+
+            delay = start + message_id * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    # Drain the queue and let open bursts fan out their verdicts
+    deadline = time.perf_counter() + args.drain_timeout
+    while ((len(bot.scoring_queue) or in_progress or len(bot.bursts) or bot.burst_tasks)
+           and time.perf_counter() < deadline):
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+
+    traced = None
+    if args.tracemalloc:
+        traced = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    await bot.scoring_workers.stop()
+    await bot.batcher.stop()
+    await bot.alerts.stop()
+    await bot.channel_store.close()
+    await bot.audit_log.close()
+    await bot.verdict_cache.close()
+
+    report = {
+        'messages': message_id,
+        'verdicts': len(latencies),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_msg_s': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'latency_p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'latency_p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'latency_p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'backend_calls': backend.calls,
+        'backend_errors': backend.errors,
+        'backend_timeouts': backend.timeouts,
+        'alerts_sent': sum(channel.sent for channel in channels.values()),
+        'max_rss_growth_kb': rss_after - rss_before,
+        'skipped': {reason: count for (reason,), count in bot.skipped.values.items()},
+        'verdict_sources': {source: count for (source,), count in bot.verdicts.values.items()},
+        'cache': bot.verdict_cache.stats(),
+        'prefilter_saved': bot.prefilter.calls_saved(),
+        'bursts': bot.bursts.stats,
+        'audit_log': bot.audit_log.stats,
+    }
+    if traced is not None:
+        report['tracemalloc_current_kb'] = traced[0] // 1024
+        report['tracemalloc_peak_kb'] = traced[1] // 1024
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpus', default=os.path.join(REPO_ROOT, 'bench', 'corpus.jsonl'))
+    parser.add_argument('--rate', type=float, default=100.0, help='Messages per second to replay')
+    parser.add_argument('--repeat', type=int, default=1, help='Times to replay the corpus')
+    parser.add_argument('--latency-ms', type=float, default=250.0, help='Median fake backend latency')
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help='Log-normal spread of backend latency')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of backend calls that fail')
+    parser.add_argument('--timeout-rate', type=float, default=0.0, help='Fraction of backend calls that hang, then time out')
+    parser.add_argument('--drain-timeout', type=float, default=60.0, help='Seconds to wait for queued work after replay')
+    parser.add_argument('--burst-window', type=float, default=2.0, help='Seconds the burst detector groups copies')
+    parser.add_argument('--tracemalloc', action='store_true', help='Track Python allocations (slower)')
+    parser.add_argument('--log-level', default='CRITICAL', help='Bot log level during the replay')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--generate', type=int, metavar='N',
+                        help='Print a generated corpus of N mostly distinct messages as JSONL and exit')
+    args = parser.parse_args()
+
+    if args.generate:
+        for record in generate_corpus(args.generate, seed=args.seed):
+            print(json.dumps(record))
+        return
+
+    # Run against throwaway local state so the replay never touches the real files
+    args.corpus = os.path.abspath(args.corpus)
+    os.environ.setdefault('PREFILTER_LEXICON', os.path.join(REPO_ROOT, 'prefilter_lexicon.json'))
+    os.environ['VERDICT_CACHE_PATH'] = ''
+    os.environ['METRICS_PORT'] = ''
+    os.environ['LOG_LEVEL'] = args.log_level
+    os.environ['BURST_WINDOW'] = str(args.burst_window)
+    os.chdir(tempfile.mkdtemp(prefix='detox-bench-'))
+
+    report = asyncio.run(replay(args))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,48 +1,38 @@
+import time
+STARTED_AT = time.perf_counter()  # Baseline for cold start timing
+
 import os
 import discord
 from discord.ext import commands
 from dotenv import load_dotenv
 import json
 import logging
-import time
 import sys
+import argparse
 import asyncio
-import subprocess
+import atexit
+import typing
 import signal
 from gradio_client import Client
-
-def kill_existing_bots():
-    """Kill any existing instances of the bot"""
-    try:
-        # Get the current process ID to avoid killing ourselves
-        current_pid = os.getpid()
-        
-        # Use ps command to find all python processes running bot.py
-        ps = subprocess.Popen(['ps', 'aux'], stdout=subprocess.PIPE)
-        output = subprocess.check_output(['grep', 'python bot.py'], stdin=ps.stdout)
-        ps.wait()
-        
-        # Parse the output to get PIDs and kill other instances
-        for line in output.decode().split('\n'):
-            if line.strip():
-                try:
-                    pid = int(line.split()[1])
-                    if pid != current_pid:
-                        print(f"Killing existing bot instance with PID: {pid}")
-                        os.kill(pid, signal.SIGTERM)
-                except (IndexError, ValueError) as e:
-                    continue
-                except ProcessLookupError:
-                    continue
-    except subprocess.CalledProcessError:
-        print("No existing bot instances found")
-    except Exception as e:
-        print(f"Error while killing existing bots: {e}")
-
-# Kill existing instances before starting new one
-print("\n=== Checking for existing bot instances ===")
-kill_existing_bots()
-print("=== Starting new bot instance ===\n")
+from batching import RequestCoalescer
+from verdict_cache import VerdictCache, cache_key
+from prefilter import PreFilter, CLEAN, FLAGGED
+from scoring_queue import FairScoringQueue, ScoringWorkerPool
+from dedup import ExpiringKeySet
+from alert_dispatcher import AlertDispatcher
+from async_logging import JsonLinesFormatter, setup_async_logging
+from metrics import MetricsRegistry
+from backend_pool import BackendPool, CircuitBreaker, CircuitOpenError
+from channel_store import ChannelStore
+from shared_stats import SharedStats, combine
+from history_scan import ScanSummary, batched, parse_scan_target
+from singleton import SingleInstanceLock, AlreadyRunningError
+from channel_policy import ChannelPolicy, ALERT_FORMATS
+from edit_tracker import EditCoalescer
+from offenders import OffenderTracker
+from burst_detector import BurstDetector
+from audit_log import AuditLog
+from chunking import merge_results, message_sources, split_segments, triggering_segment
 
 # Set up logging configuration
 logging.basicConfig(
@@ -51,9 +41,12 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# Load environment variables from .env file
+load_dotenv()
+
 # Create and configure logger
 logger = logging.getLogger('discord_bot')
-logger.setLevel(logging.INFO)
+logger.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
 logger.propagate = False  # Prevent duplicate logs
 
 # Create a filter to remove Discord heartbeat messages
@@ -66,57 +59,223 @@ for handler in logger.handlers[:]:
     logger.removeHandler(handler)
 
 console_handler = logging.StreamHandler(sys.stdout)
-console_handler.setLevel(logging.INFO)
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+if os.getenv('LOG_FORMAT', 'text') == 'json':
+    formatter = JsonLinesFormatter()
+else:
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 console_handler.setFormatter(formatter)
 console_handler.addFilter(HeartbeatFilter())
-logger.addHandler(console_handler)
+
+# Write records from a background thread; per-message debug output is sampled
+log_listener = setup_async_logging(
+    logger,
+    [console_handler],
+    sample_rate=float(os.getenv('LOG_SAMPLE_RATE', '0.01'))
+)
+atexit.register(log_listener.stop)  # Flush queued records on exit
+
+# Where a message's verdict came from, cheapest first
+VERDICT_SOURCES = ('prefilter', 'cache', 'burst', 'backend', 'degraded', 'error')
 
 # Reduce Discord.py's default logging noise
 discord_logger = logging.getLogger('discord')
 discord_logger.setLevel(logging.WARNING)
 
-# Load environment variables from .env file
-load_dotenv()
-
-class ToxicityBot(commands.Bot):
-    def __init__(self):
+class ToxicityBot(commands.AutoShardedBot):
+    def __init__(self, client=None, shard_ids=None, shard_count=None, worker_id=None):
         # Set up bot with message content intent enabled
         intents = discord.Intents.default()
         intents.message_content = True
         intents.guilds = True  # Enable guilds intent
         intents.messages = True  # Make sure message intent is enabled
-        super().__init__(command_prefix='!', intents=intents, case_insensitive=True)  # Make commands case-insensitive
+        super().__init__(
+            command_prefix='!',
+            intents=intents,
+            case_insensitive=True,  # Make commands case-insensitive
+            shard_ids=shard_ids,    # Shards owned by this process when run under supervisor.py
+            shard_count=shard_count
+        )
+        self.worker_id = worker_id
         
         # Set command attributes
         self.add_commands()
         
-        # Initialize rate limiting system
-        self.message_cooldown = {}      # Track processed messages
-        self.last_message_time = {}     # Track timing of last message per channel
-        self.rate_limit_delay = 1.0     # Minimum seconds between messages
+        # Metrics registry; timers are cheap enough to stay on permanently
+        self.metrics = MetricsRegistry()
+        self.backend_latency = self.metrics.histogram(
+            'detox_backend_latency_seconds', 'Latency of Gradio backend calls')
+        self.backend_calls = self.metrics.counter(
+            'detox_backend_calls_total', 'Gradio backend calls by outcome', ('outcome',))
+        self.verdicts = self.metrics.counter(
+            'detox_verdicts_total', 'Scored messages by verdict source', ('source',))
+        self.flagged = self.metrics.counter(
+            'detox_flagged_total', 'Flagged messages by highest category', ('category',))
+        self.verdict_latency = self.metrics.histogram(
+            'detox_message_verdict_latency_seconds', 'Time from message creation to verdict')
+        self.skipped = self.metrics.counter(
+            'detox_messages_skipped_total', 'Messages skipped before scoring by reason', ('reason',))
+        self.alert_wait = self.metrics.histogram(
+            'detox_alert_wait_seconds', 'Time alerts spend waiting on rate limits before sending')
+        
+        # Initialize message deduplication
+        self.message_cooldown = ExpiringKeySet(ttl=60)  # Track processed (channel_id, message_id) keys
+        self.max_message_age = 30       # Ignore messages older than this many seconds
+        
+        # Rapid edits of one message settle into a single rescore
+        self.edits = EditCoalescer(
+            lambda message: self._enqueue_message(message, edited=True),
+            settle_delay=float(os.getenv('EDIT_SETTLE_DELAY', '2.0'))
+        )
+        self.deferred_edits = {}        # (channel_id, message_id) -> edit that settled while the message was being scored
+        
+        # Long messages and text attachments are scored as overlapping segments
+        self.chunk_max_chars = int(os.getenv('CHUNK_MAX_CHARS', '512'))
+        self.chunk_overlap = int(os.getenv('CHUNK_OVERLAP', '64'))
+        self.max_segments = int(os.getenv('CHUNK_MAX_SEGMENTS', '24'))
+        self.attachment_max_bytes = int(os.getenv('ATTACHMENT_MAX_BYTES', '8192'))
+        self.attachment_max_count = int(os.getenv('ATTACHMENT_MAX_COUNT', '3'))
+        
+        # Copies of one message posted across a guild within a short window are scored once
+        self.bursts = BurstDetector(
+            self._on_burst,
+            window=float(os.getenv('BURST_WINDOW', '10')),
+            max_distance=int(os.getenv('BURST_MAX_DISTANCE', '4')),
+            min_length=int(os.getenv('BURST_MIN_LENGTH', '20'))
+        )
+        self.raid_min_messages = int(os.getenv('RAID_MIN_MESSAGES', '3'))
+        self.burst_tasks = set()
+        
+        # Append-only record of flagged verdicts for !history and offline analysis
+        self.audit_log = AuditLog(
+            path=os.getenv('AUDIT_LOG_PATH', 'audit_log.db'),
+            flush_interval=float(os.getenv('AUDIT_LOG_FLUSH_INTERVAL', '2.0'))
+        )
+        
+        # Rolling per-user verdict history for repeat-offender escalation and !offenders
+        self.offenders = OffenderTracker(
+            max_bytes=int(float(os.getenv('OFFENDER_MAX_MB', '16')) * 1024 * 1024),
+            capacity=int(os.getenv('OFFENDER_HISTORY', '32')),
+            window=float(os.getenv('OFFENDER_WINDOW', '86400')),
+            idle_ttl=float(os.getenv('OFFENDER_WINDOW', '86400')),
+            half_life=float(os.getenv('OFFENDER_HALF_LIFE', '3600')),
+            escalate_after=int(os.getenv('OFFENDER_ESCALATE_AFTER', '3')),
+            escalate_window=float(os.getenv('OFFENDER_ESCALATE_WINDOW', '600'))
+        )
+        
+        # Outbound alerts go through per-channel and global token buckets
+        self.alerts = AlertDispatcher(
+            channel_rate=float(os.getenv('ALERT_CHANNEL_RATE', '1.0')),
+            channel_burst=int(os.getenv('ALERT_CHANNEL_BURST', '1')),
+            global_rate=float(os.getenv('ALERT_GLOBAL_RATE', '40')),
+            global_burst=int(os.getenv('ALERT_GLOBAL_BURST', '40')),
+            wait_histogram=self.alert_wait
+        )
         
         # Initialize command processing locks
         self.command_locks = {}         # Prevent duplicate command processing
+        self.active_scans = {}          # channel_id -> running !scan task
+        self.scan_batch_size = int(os.getenv('SCAN_BATCH_SIZE', '50'))
+        self.scan_concurrency = int(os.getenv('SCAN_CONCURRENCY', '8'))
         
         # Initialize bot state
-        self.analyzing_channels = set()  # Set of channels being monitored
-        self.client = Client("https://duchaba-friendly-text-moderation.hf.space/")
+        # Monitored channels and their configuration, persisted across restarts
+        self.channel_store = ChannelStore(
+            path=os.getenv('CHANNEL_STORE_PATH', 'channel_state.db'),
+            debounce=float(os.getenv('CHANNEL_STORE_DEBOUNCE', '1.0'))
+        )
+        self.analyzing_channels = self.channel_store  # Supports `in`, iteration and len()
+        self.policies = {}  # channel_id -> compiled ChannelPolicy, rebuilt only when the policy changes
+        print(f"Loaded {len(self.analyzing_channels)} channels from the channel store")
         
-        # Load previously monitored channels from file
-        try:
-            with open('analyzing_channels.json', 'r') as f:
-                channels = json.load(f)
-                self.analyzing_channels = set(channels) if channels else set()
-                print(f"Loaded {len(self.analyzing_channels)} channels from file")
-        except FileNotFoundError:
-            print("No analyzing_channels.json file found. Creating new one.")
-            with open('analyzing_channels.json', 'w') as f:
-                json.dump([], f)
-        except Exception as e:
-            print(f"Error loading analyzing_channels.json: {e}")
-            import traceback
-            print(traceback.format_exc())
+        # Pool of Gradio clients for the moderation space, connected lazily so startup never waits on
+        # the network (a client can be injected for offline benchmarks)
+        if client is not None:
+            client_factory, pool_size = (lambda: client), 1
+        else:
+            client_factory = lambda: Client("https://duchaba-friendly-text-moderation.hf.space/")
+            pool_size = int(os.getenv('BACKEND_POOL_SIZE', '2'))
+        hedge_ms = os.getenv('BACKEND_HEDGE_MS')
+        self.backend = BackendPool(
+            client_factory,
+            size=pool_size,
+            threads=int(os.getenv('BACKEND_THREADS', '8')),
+            timeout=float(os.getenv('BACKEND_TIMEOUT', '10')),
+            hedge_delay=float(hedge_ms) / 1000 if hedge_ms else None,
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv('BREAKER_FAILURES', '5')),
+                reset_timeout=float(os.getenv('BREAKER_RESET', '30'))
+            )
+        )
+        
+        # Local pre-filter settles obvious messages without a remote call
+        self.prefilter = PreFilter.from_file(
+            os.getenv('PREFILTER_LEXICON', 'prefilter_lexicon.json'),
+            min_length=int(os.getenv('PREFILTER_MIN_LENGTH', '3'))
+        )
+        
+        # Cache verdicts by normalized message text so repeated messages skip scoring
+        self.verdict_cache = VerdictCache(
+            max_entries=int(os.getenv('VERDICT_CACHE_SIZE', '10000')),
+            ttl=float(os.getenv('VERDICT_CACHE_TTL', '3600')),
+            path=os.getenv('VERDICT_CACHE_PATH') or None,
+            shared=worker_id is not None  # Sharded workers share verdicts through the cache file
+        )
+        
+        # Coalesce identical in-flight scoring requests from all channels in front of the Gradio API
+        self.batcher = RequestCoalescer(
+            self._score_text,
+            max_in_flight=int(os.getenv('BACKEND_MAX_IN_FLIGHT', '4'))
+        )
+        
+        # Bounded, guild-fair queue drained by a fixed pool of scoring workers
+        self.scoring_queue = FairScoringQueue(
+            capacity=int(os.getenv('SCORING_QUEUE_SIZE', '1000')),
+            policy=os.getenv('SHED_POLICY', 'drop_oldest'),
+            sample_rate=float(os.getenv('SHED_SAMPLE_RATE', '0.1'))
+        )
+        self.scoring_workers = ScoringWorkerPool(
+            self.scoring_queue,
+            self._process_message,
+            workers=int(os.getenv('SCORING_WORKERS', '8'))
+        )
+        
+        # Gauges read component state at scrape time
+        self.metrics.gauge('detox_scoring_queue_depth', 'Messages waiting for a scoring worker',
+                           lambda: len(self.scoring_queue))
+        self.metrics.gauge('detox_scoring_queue', 'Scoring queue counters',
+                           lambda: self.scoring_queue.stats, 'stat')
+        self.metrics.gauge('detox_verdict_cache', 'Verdict cache counters and hit ratio',
+                           self.verdict_cache.stats, 'stat')
+        self.metrics.gauge('detox_prefilter', 'Pre-filter outcomes by reason',
+                           lambda: self.prefilter.stats, 'reason')
+        self.metrics.gauge('detox_batcher', 'Request coalescing counters',
+                           lambda: self.batcher.stats, 'stat')
+        self.metrics.gauge('detox_backend_degraded', 'Whether the backend circuit breaker is open or half-open',
+                           lambda: int(self.backend.degraded))
+        self.startup_timings = {}  # phase -> seconds since process start
+        self.metrics.gauge('detox_startup_seconds', 'Seconds from process start to each startup phase',
+                           lambda: self.startup_timings, 'phase')
+        self.metrics.gauge('detox_backend_pool', 'Backend pool counters (hedges, timeouts, rejected calls)',
+                           lambda: self.backend.stats, 'stat')
+        self.metrics.gauge('detox_edits', 'Edit rescoring counters (coalesced and trivial edits are not rescored)',
+                           lambda: self.edits.stats, 'stat')
+        self.metrics.gauge('detox_offenders', 'Tracked users, approximate bytes and offender tracker counters',
+                           lambda: {**self.offenders.stats, 'users': len(self.offenders),
+                                    'bytes': self.offenders.memory_bytes()}, 'stat')
+        self.metrics.gauge('detox_bursts', 'Burst detector counters (duplicates are not scored separately)',
+                           lambda: self.bursts.stats, 'stat')
+        self.metrics.gauge('detox_audit_log', 'Audit log records queued, written and dropped',
+                           lambda: self.audit_log.stats, 'stat')
+        self.metrics.gauge('detox_alerts', 'Alert dispatcher counters (rate_limited counts 429s)',
+                           lambda: self.alerts.stats, 'stat')
+        
+        # Sharded workers publish stats snapshots where every worker can read them
+        self.shared_stats = None
+        if worker_id is not None:
+            self.shared_stats = SharedStats(
+                path=os.getenv('SHARED_STATS_PATH', 'shared_stats.db'),
+                worker_id=worker_id
+            )
 
     def add_commands(self):
         """Add commands to the bot"""
@@ -134,6 +293,44 @@ class ToxicityBot(commands.Bot):
             print(f"Received command !stop from {ctx.author} in {ctx.channel}")
             await bot_instance._handle_stop(ctx.channel.id, ctx.send)
 
+        @self.command(name='policy', help='Show or change this channel\'s flagging policy: '
+                      '!policy [threshold <0-1>|category <name> <0-1|default>|ignore <name>|unignore <name>|'
+                      'format <full|compact>|report <0-1>|top <n>|reset]')
+        @commands.has_permissions(manage_channels=True)
+        async def policy_prefix(ctx, setting: str = None, *values):
+            """Show or change the channel policy (prefix command)"""
+            print(f"Received command !policy from {ctx.author} in {ctx.channel}")
+            await bot_instance._handle_policy(ctx.channel.id, setting, values, ctx.send)
+
+        @self.command(name='stats', help='Show bot performance statistics (admins only)')
+        @commands.has_permissions(manage_guild=True)
+        async def stats_prefix(ctx):
+            """Show performance statistics (prefix command)"""
+            print(f"Received command !stats from {ctx.author} in {ctx.channel}")
+            await bot_instance._handle_stats(ctx.send)
+
+        @self.command(name='history', help='Show flagged messages: !history @user|user_id|#channel [limit|30m|12h|2d|YYYY-MM-DD]')
+        @commands.has_permissions(manage_messages=True)
+        async def history_prefix(ctx, target: typing.Union[discord.Member, discord.TextChannel, discord.User, int],
+                                 since: str = None):
+            """Query the flagged message audit log (prefix command)"""
+            print(f"Received command !history from {ctx.author} in {ctx.channel}")
+            await bot_instance._handle_history(ctx.guild, target, since, ctx.send)
+
+        @self.command(name='offenders', help='List the most flagged users in this server recently')
+        @commands.has_permissions(manage_messages=True)
+        async def offenders_prefix(ctx, limit: int = 10):
+            """List repeat offenders (prefix command)"""
+            print(f"Received command !offenders from {ctx.author} in {ctx.channel}")
+            await bot_instance._handle_offenders(ctx.guild, limit, ctx.send)
+
+        @self.command(name='scan', help='Scan channel history: !scan [limit|30m|12h|2d|YYYY-MM-DD] (resumes if interrupted)')
+        @commands.has_permissions(manage_messages=True)
+        async def scan_prefix(ctx, target: str = None):
+            """Scan channel history for toxicity (prefix command)"""
+            print(f"Received command !scan from {ctx.author} in {ctx.channel}")
+            await bot_instance._handle_scan(ctx.channel, target, ctx.send)
+
     async def _handle_analyze(self, channel_id, send_message):
         """Handle the analyze command logic"""
         print(f"Handling analyze command for channel {channel_id}")
@@ -153,17 +350,8 @@ class ToxicityBot(commands.Bot):
                 return
                 
             print(f"Starting analysis for channel {channel_id}")
-            self.analyzing_channels.add(channel_id)
-            
-            # Save to file
-            try:
-                with open('analyzing_channels.json', 'w') as f:
-                    json.dump(list(self.analyzing_channels), f)
-                    print(f"Saved {len(self.analyzing_channels)} channels to file")
-            except Exception as e:
-                print(f"Error saving analyzing_channels.json: {e}")
-                import traceback
-                print(traceback.format_exc())
+            # Saved to disk in the background by the channel store
+            self.channel_store.add(channel_id, {'added_at': time.time()})
             
             # Send confirmation with updated message
             embed = discord.Embed(
@@ -182,6 +370,273 @@ class ToxicityBot(commands.Bot):
             self.command_locks[channel_id] = False
             print(f"Released lock for channel {channel_id}")
 
+    def policy_for(self, channel_id):
+        """Compiled policy for a channel (the default policy for unmonitored channels)"""
+        policy = self.policies.get(channel_id)
+        if policy is None:
+            try:
+                policy = ChannelPolicy.from_config(self.channel_store.get_config(channel_id))
+            except (TypeError, ValueError):
+                logger.exception("Invalid policy for channel %s; using the default", channel_id)
+                policy = ChannelPolicy()
+            self.policies[channel_id] = policy
+        return policy
+
+    async def _handle_policy(self, channel_id, setting, values, send_message):
+        """Handle the policy command logic"""
+        if channel_id not in self.analyzing_channels:
+            await send_message("⚠️ This channel is not being analyzed! Use `!analyze` first.")
+            return
+        
+        policy = self.policy_for(channel_id)
+        try:
+            if setting is None:
+                pass
+            elif setting == 'threshold' and len(values) == 1:
+                policy = policy.replace(threshold=float(values[0]))
+            elif setting == 'category' and len(values) == 2:
+                thresholds = dict(policy.category_thresholds)
+                if values[1] == 'default':
+                    thresholds.pop(values[0], None)
+                else:
+                    thresholds[values[0]] = float(values[1])
+                policy = policy.replace(category_thresholds=thresholds)
+            elif setting == 'ignore' and len(values) == 1:
+                policy = policy.replace(ignored=policy.ignored | {values[0]})
+            elif setting == 'unignore' and len(values) == 1:
+                policy = policy.replace(ignored=policy.ignored - {values[0]})
+            elif setting == 'format' and len(values) == 1:
+                policy = policy.replace(alert_format=values[0])
+            elif setting == 'report' and len(values) == 1:
+                policy = policy.replace(report_threshold=float(values[0]))
+            elif setting == 'top' and len(values) == 1:
+                policy = policy.replace(top_n=int(values[0]))
+            elif setting == 'reset':
+                policy = ChannelPolicy()
+            else:
+                await send_message(
+                    "❌ Usage: `!policy [threshold <0-1>|category <name> <0-1|default>|ignore <name>|"
+                    f"unignore <name>|format <{'|'.join(ALERT_FORMATS)}>|report <0-1>|top <n>|reset]`"
+                )
+                return
+        except ValueError as e:
+            await send_message(f"❌ {e}")
+            return
+        
+        if setting is not None:
+            # Takes effect on the next verdict; stored scores are re-evaluated, never re-scored
+            self.policies[channel_id] = policy
+            self.channel_store.update_config(channel_id, policy=policy.to_dict())
+        
+        embed = discord.Embed(
+            title="⚙️ Channel Policy" + (" Updated" if setting is not None else ""),
+            description=policy.describe(),
+            color=discord.Color.blue()
+        )
+        await send_message(embed=embed)
+
+    def stats_snapshot(self):
+        """Flat counters for this process, summed across workers by !stats"""
+        cache_stats = self.verdict_cache.stats()
+        return {
+            'verdicts': self.verdicts.total(),
+            'flagged': self.flagged.total(),
+            'backend_success': self.backend_calls.values.get(('success',), 0),
+            'backend_error': self.backend_calls.values.get(('error',), 0),
+            'backend_timeout': self.backend_calls.values.get(('timeout',), 0),
+            'queue_depth': len(self.scoring_queue),
+            'cache_hits': cache_stats['hits'],
+            'cache_misses': cache_stats['misses'],
+            'prefilter_saved': self.prefilter.calls_saved(),
+            'alerts_sent': self.alerts.stats['sent'],
+            'guilds': len(self.guilds),
+        }
+
+    async def _handle_stats(self, send_message):
+        """Handle the stats command logic"""
+        verdict_count = self.verdicts.total()
+        flagged_count = self.flagged.total()
+        backend_outcomes = self.backend_calls.values
+        cache_stats = self.verdict_cache.stats()
+        
+        lines = [
+            f"**Verdicts:** {verdict_count} ({flagged_count / verdict_count if verdict_count else 0.0:.1%} flagged)",
+            f"**Verdict latency:** p50 {self.verdict_latency.quantile(0.5):.2f}s, "
+            f"p95 {self.verdict_latency.quantile(0.95):.2f}s",
+            f"**Backend calls:** {backend_outcomes.get(('success',), 0)} ok, "
+            f"{backend_outcomes.get(('error',), 0)} errors, {backend_outcomes.get(('timeout',), 0)} timeouts",
+            f"**Backend latency:** p50 {self.backend_latency.quantile(0.5):.2f}s, "
+            f"p95 {self.backend_latency.quantile(0.95):.2f}s, p99 {self.backend_latency.quantile(0.99):.2f}s",
+            f"**Backend circuit:** {self.backend.breaker.state}"
+            f"{' ⚠️ degraded, messages are not being scored' if self.backend.degraded else ''}",
+            f"**Queue depth:** {len(self.scoring_queue)} (shed {self.scoring_queue.stats['shed']})",
+            f"**Cache:** {cache_stats['entries']} entries, {cache_stats['hit_ratio']:.1%} hit ratio",
+            f"**Pre-filter:** {self.prefilter.calls_saved()} backend calls saved",
+            f"**Alerts:** {self.alerts.stats['sent']} sent, {self.alerts.stats['rate_limited']} rate limited",
+        ]
+        skipped = ", ".join(f"{reason}: {count}" for (reason,), count in sorted(self.skipped.values.items()))
+        if skipped:
+            lines.append(f"**Skipped:** {skipped}")
+        
+        # When sharded, the lines above cover this worker only; add the cluster-wide totals
+        if self.shared_stats is not None:
+            snapshots = await self.shared_stats.read_all()
+            cluster = combine(snapshots)
+            lookups = cluster.get('cache_hits', 0) + cluster.get('cache_misses', 0)
+            lines.insert(0, f"**Worker {self.worker_id}** (shards {sorted(self.shards)})")
+            lines.append(
+                f"**Cluster ({len(snapshots)} workers):** {cluster.get('guilds', 0)} guilds, "
+                f"{cluster.get('verdicts', 0)} verdicts, {cluster.get('flagged', 0)} flagged, "
+                f"{cluster.get('backend_error', 0) + cluster.get('backend_timeout', 0)} backend failures, "
+                f"queue {cluster.get('queue_depth', 0)}, "
+                f"cache hit ratio {cluster.get('cache_hits', 0) / lookups if lookups else 0.0:.1%}"
+            )
+        
+        embed = discord.Embed(
+            title="📊 Bot Statistics",
+            description="\n".join(lines),
+            color=discord.Color.blue()
+        )
+        await send_message(embed=embed)
+
+    async def _handle_history(self, guild, target, since, send_message):
+        """Handle the history command logic"""
+        try:
+            limit, since_time = parse_scan_target(since, default_limit=20)
+        except ValueError:
+            await send_message("❌ Usage: `!history @user|user_id|#channel [limit|30m|12h|2d|YYYY-MM-DD]`")
+            return
+        limit = max(1, min(limit or 20, 50))
+        since_ts = since_time.timestamp() if since_time else None
+        
+        # Flush first so incidents from the last few seconds are included
+        await self.audit_log.flush()
+        if isinstance(target, discord.abc.GuildChannel):
+            mention = target.mention
+            records = await self.audit_log.by_channel(target.id, since=since_ts, limit=limit)
+        else:
+            # Users who left or were banned are looked up by ID; the audit log is already scoped to the guild
+            user_id = target if isinstance(target, int) else target.id
+            mention = f"<@{user_id}>"
+            records = await self.audit_log.by_user(guild.id if guild else 0, user_id, since=since_ts, limit=limit)
+        if not records:
+            await send_message(f"✅ No flagged messages for {mention}.")
+            return
+        
+        lines = [
+            f"<t:{int(record['flagged_at'])}:R> <#{record['channel_id']}> <@{record['author_id']}> "
+            f"{record['max_category']} {record['max_score']:.0%} ({record['outcome']}) "
+            f"[link](https://discord.com/channels/{record['guild_id']}/{record['channel_id']}/{record['message_id']})"
+            for record in records
+        ]
+        embed = discord.Embed(
+            title=f"📜 Flagged Messages ({len(records)} most recent)",
+            description=f"For {mention}\n\n" + "\n".join(lines)[:4000],
+            color=discord.Color.orange()
+        )
+        await send_message(embed=embed)
+
+    async def _handle_offenders(self, guild, limit, send_message):
+        """Handle the offenders command logic"""
+        ranked = self.offenders.offenders(guild.id if guild else 0, limit=max(1, min(limit, 25)))
+        if not ranked:
+            await send_message("✅ No flagged users in the tracked window.")
+            return
+        
+        lines = []
+        for user_id, summary in ranked:
+            categories = sorted(summary['categories'].items(), key=lambda item: item[1]['max'], reverse=True)
+            top = ", ".join(f"{name} max {stats['max']:.0%} / mean {stats['mean']:.0%}" for name, stats in categories[:3])
+            lines.append(f"<@{user_id}>: **{summary['flags']} flags** ({top})")
+        
+        embed = discord.Embed(
+            title="🚩 Repeat Offenders",
+            description="\n".join(lines)[:4096],
+            color=discord.Color.orange()
+        )
+        embed.set_footer(text=f"Last {self.offenders.window / 3600:g}h, scores decayed with a "
+                              f"{self.offenders.half_life / 60:g} min half-life")
+        await send_message(embed=embed)
+
+    async def _handle_scan(self, channel, target, send_message):
+        """Handle the scan command logic"""
+        if channel.id in self.active_scans:
+            await send_message("⚠️ A scan is already running in this channel!")
+            return
+        
+        # Claim the channel before the first await so a second !scan can't start alongside this one
+        self.active_scans[channel.id] = asyncio.current_task()
+        try:
+            # No argument resumes an interrupted scan; an explicit target starts over
+            checkpoint = await self.channel_store.load_checkpoint(channel.id)
+            if target is None and checkpoint is not None:
+                summary = ScanSummary.from_dict(checkpoint['summary'])
+                after = discord.Object(id=checkpoint['after']) if checkpoint['after'] else None
+                remaining = checkpoint['remaining']
+                await send_message(f"▶️ Resuming scan after {summary.scanned} messages...")
+            else:
+                try:
+                    limit, since = parse_scan_target(target)
+                except ValueError:
+                    await send_message("❌ Usage: `!scan [limit|30m|12h|2d|YYYY-MM-DD]`")
+                    return
+                summary = ScanSummary()
+                after = since
+                remaining = limit
+                if since is None:
+                    # A count means the most recent messages: find where they start, then stream forward
+                    after = await self._scan_start(channel, limit)
+            
+            progress = await send_message("🔍 Scanning channel history...")
+            await self._run_scan(channel, summary, after, remaining, progress)
+            await send_message(embed=summary.embed())
+        except Exception:
+            logger.exception("Error in scan for channel %s", channel.id)
+            await send_message("❌ Scan stopped by an error. Run `!scan` again to resume.")
+        finally:
+            self.active_scans.pop(channel.id, None)
+
+    async def _scan_start(self, channel, limit):
+        """Position just before the oldest of the channel's newest `limit` messages"""
+        oldest = None
+        async for message in channel.history(limit=limit):
+            oldest = message
+        return discord.Object(id=oldest.id - 1) if oldest is not None else None
+
+    async def _run_scan(self, channel, summary, after, remaining, progress):
+        """Stream history oldest-first, score it in batches and checkpoint after each batch"""
+        semaphore = asyncio.Semaphore(self.scan_concurrency)
+        
+        policy = self.policy_for(channel.id)
+        
+        async def score(message):
+            async with semaphore:
+                _, result = await self.analyze_message(message)
+                return message, policy.evaluate(result)
+        
+        history = channel.history(limit=remaining, after=after, oldest_first=True)
+        async for batch in batched(history, self.scan_batch_size):
+            messages = [
+                m for m in batch
+                if m.author != self.user and (m.content or m.attachments or m.embeds)
+                and not m.content.startswith(self.command_prefix)
+            ]
+            for message, result in await asyncio.gather(*(score(m) for m in messages)):
+                summary.add(message, result)
+            
+            # Checkpoint so an interrupted scan resumes after this batch
+            if remaining is not None:
+                remaining -= len(batch)
+            await self.channel_store.save_checkpoint(channel.id, {
+                'after': batch[-1].id,
+                'remaining': remaining,
+                'summary': summary.to_dict(),
+            })
+            await progress.edit(content=f"🔍 Scanned {summary.scanned} messages, {summary.flagged} flagged...")
+        
+        await self.channel_store.save_checkpoint(channel.id, None)
+        await progress.edit(content=f"✅ Scan complete: {summary.scanned} messages.")
+
     async def _handle_stop(self, channel_id, send_message):
         """Handle the stop command logic"""
         print(f"Handling stop command for channel {channel_id}")
@@ -190,14 +645,10 @@ class ToxicityBot(commands.Bot):
             return
             
         try:
-            # Clean up channel resources
+            # Stop monitoring (saved to disk in the background) and clean up channel resources
+            self.channel_store.remove(channel_id)
             await self.cleanup_channel(channel_id)
             
-            # Update file
-            with open('analyzing_channels.json', 'w') as f:
-                json.dump(list(self.analyzing_channels), f)
-                print(f"Saved {len(self.analyzing_channels)} channels to file")
-            
             embed = discord.Embed(
                 title="🛑 Analysis Stopped",
                 description="I will no longer analyze messages in this channel.",
@@ -212,87 +663,112 @@ class ToxicityBot(commands.Bot):
             await send_message("❌ An error occurred while stopping analysis.")
 
     async def cleanup_channel(self, channel_id):
-        """Clean up resources for a channel"""
-        # Remove from analyzing channels
-        self.analyzing_channels.discard(channel_id)
+        """Clean up runtime resources for a channel"""
+        # Drop queued work for this channel
+        self.scoring_queue.drop_channel(channel_id)
         
-        # Clear cooldowns for this channel
-        channel_cooldowns = [k for k in self.message_cooldown.keys() if k.startswith(f"{channel_id}:")]
-        for key in channel_cooldowns:
-            self.message_cooldown.pop(key, None)
+        # Clear cooldowns and pending edits for this channel
+        self.message_cooldown.discard_channel(channel_id)
+        self.edits.drop_channel(channel_id)
+        for key in [key for key in self.deferred_edits if key[0] == channel_id]:
+            del self.deferred_edits[key]
         
-        # Clear rate limit tracking
-        self.last_message_time.pop(channel_id, None)
+        # Clear pending alerts and rate limit tracking
+        self.alerts.drop_channel(channel_id)
         
-        # Clear command locks
+        # Clear command locks and the compiled policy
         self.command_locks.pop(channel_id, None)
+        self.policies.pop(channel_id, None)
 
     async def close(self):
         """Cleanup when bot shuts down"""
         print("\n=== Bot shutting down ===")
         
-        # Clean up all channels
+        # Interrupt history scans; their checkpoints let `!scan` resume after restart
+        for task in list(self.active_scans.values()):
+            task.cancel()
+        
+        # Stop scoring workers and batching before tearing down channel state
+        self.edits.clear()
+        self.deferred_edits.clear()
+        self.bursts.clear()
+        for task in list(self.burst_tasks):
+            task.cancel()
+        await self.scoring_workers.stop()
+        await self.batcher.stop()
+        await self.alerts.stop()
+        await self.metrics.stop_server()
+        self.backend.close()
+        
+        # Persist cached verdicts and report how well the cache is sized
+        print(f"Verdict cache stats: {self.verdict_cache.stats()}")
+        print(f"Pre-filter saved {self.prefilter.calls_saved()} backend calls: {self.prefilter.stats}")
+        await self.verdict_cache.close()
+        
+        # Clean up runtime state for all channels; monitored channels are kept for the next start
         for channel_id in list(self.analyzing_channels):
             await self.cleanup_channel(channel_id)
         
         # Clear all collections
-        self.analyzing_channels.clear()
         self.message_cooldown.clear()
-        self.last_message_time.clear()
         self.command_locks.clear()
         
-        # Save empty state
-        try:
-            with open('analyzing_channels.json', 'w') as f:
-                json.dump([], f)
-        except Exception as e:
-            print(f"Error saving empty analyzing_channels.json: {e}")
+        # Write any pending channel changes and audit records
+        await self.channel_store.close()
+        await self.audit_log.close()
+        if self.shared_stats is not None:
+            await self.shared_stats.close()
         
         print("=== Cleanup complete ===\n")
         await super().close()
 
     async def send_with_rate_limit(self, channel, content=None, embed=None):
-        """Send a message with Discord rate limit handling"""
-        channel_id = channel.id
-        current_time = time.time()
-        
-        # Implement rate limiting
-        if channel_id in self.last_message_time:
-            time_since_last = current_time - self.last_message_time[channel_id]
-            if time_since_last < self.rate_limit_delay:
-                await asyncio.sleep(self.rate_limit_delay - time_since_last)
-        
-        try:
-            # Send the message
-            if content:
-                await channel.send(content)
-            elif embed:
-                await channel.send(embed=embed)
-            self.last_message_time[channel_id] = time.time()
-            
-        except discord.errors.HTTPException as e:
-            if e.status == 429:  # Rate limit error
-                # Handle Discord's rate limiting
-                retry_after = e.retry_after if hasattr(e, 'retry_after') else 5
-                await asyncio.sleep(retry_after)
-                # Retry the message once
-                if content:
-                    await channel.send(content)
-                elif embed:
-                    await channel.send(embed=embed)
-                self.last_message_time[channel_id] = time.time()
+        """Queue a message on the alert dispatcher, which handles Discord rate limits in the background"""
+        self.alerts.enqueue(channel, content=content, embed=embed)
 
     async def setup_hook(self):
         """Initialize bot on startup"""
+        self.batcher.start()
+        self.scoring_workers.start()
+        self.alerts.start()
+        self.channel_store.start()
+        self.verdict_cache.start()
+        self.audit_log.start()
+        if self.shared_stats is not None:
+            self.shared_stats.start(self.stats_snapshot)
+        
+        # Serve Prometheus metrics locally if a port is configured
+        metrics_port = os.getenv('METRICS_PORT')
+        if metrics_port:
+            await self.metrics.start_server(os.getenv('METRICS_HOST', '127.0.0.1'), int(metrics_port))
+        
+        # Connect the backend in the background so login is not blocked on the Hugging Face space
+        self._backend_warmup = asyncio.create_task(self._warm_up_backend())
+        
+        self.startup_timings['setup'] = time.perf_counter() - STARTED_AT
+        print(f"Setup complete in {self.startup_timings['setup']:.2f}s")
         print(f"{self.user} has connected to Discord!")
         if not self.analyzing_channels:
             print("No channels are being analyzed yet")
         else:
-            print(f"Currently analyzing channels: {self.analyzing_channels}")
+            print(f"Currently analyzing channels: {list(self.analyzing_channels)}")
+
+    async def _warm_up_backend(self):
+        """Connect backend clients and optionally send one warm-up request"""
+        try:
+            await self.backend.connect()
+            if os.getenv('BACKEND_WARMUP', '0') == '1':
+                await self._score_text("hello")
+            self.startup_timings['backend_ready'] = time.perf_counter() - STARTED_AT
+            print(f"Backend ready {self.startup_timings['backend_ready']:.2f}s after start")
+        except Exception:
+            # Scoring calls retry the connection; until then they fail through the circuit breaker
+            logger.exception("Backend warm-up failed")
 
     async def on_ready(self):
         """Called when the bot is ready"""
-        print(f"Logged in as {self.user}")
+        self.startup_timings.setdefault('ready', time.perf_counter() - STARTED_AT)
+        print(f"Logged in as {self.user} ({self.startup_timings['ready']:.2f}s after start)")
         
         # Print registered commands
         print("\nCommands registered:")
@@ -313,76 +789,143 @@ class ToxicityBot(commands.Bot):
             print(f"- Read Message History: {guild.me.guild_permissions.read_message_history}")
 
     async def analyze_text(self, text):
-        """Analyze text using the Gradio API for toxicity detection"""
-        print("\n" + "="*50)
-        print("TOXICITY ANALYSIS REQUEST")
-        print("="*50)
-        print(f"Input Text: {text}")
+        """Analyze text for toxicity: local pre-filter, then verdict cache, then the request coalescer
+
+        Returns (source, result); callers count one verdict per message by its source.
+        """
+        verdict, reason, category = self.prefilter.classify(text)
+        if verdict == CLEAN:
+            return 'prefilter', {
+                'overall_score': 0.0,
+                'max_score': 0.0,
+                'max_category': '',
+                'category_scores': {},
+                'is_flagged': False
+            }
+        if verdict == FLAGGED:
+            return 'prefilter', {
+                'overall_score': 1.0,
+                'max_score': 1.0,
+                'max_category': category,
+                'category_scores': {category: 1.0},
+                'is_flagged': True
+            }
+        
+        cached = await self.verdict_cache.get(text)
+        if cached is not None:
+            return 'cache', cached
         
         try:
-            # Call Gradio API
-            result = await asyncio.to_thread(
-                self.client.predict,
-                text,                    # Message to analyze
-                0.5,                     # Toxicity threshold
-                "/fetch_toxicity_level", # API endpoint
-                api_name="/fetch_toxicity_level"
-            )
-            
-            # Handle tuple response from API
-            if isinstance(result, tuple) and len(result) > 1:
-                result = result[1]  # Extract JSON response
-            
-            # Parse string response if needed
-            if isinstance(result, str):
-                result = json.loads(result)
-                
-            # Log raw API response
-            print("\nAPI Response:")
-            print("-" * 30)
-            print(json.dumps(result, indent=2))
-            
-            # Extract category scores
-            category_scores = {}
-            for key, value in result.items():
-                if isinstance(value, (int, float)) and key not in [
-                    'safer_value', 'sum_value', 'max_value', 
-                    'is_flagged', 'is_safer_flagged'
-                ]:
-                    category_scores[key] = float(value)
-            
-            # Process results
-            processed_result = {
-                'overall_score': float(result.get('sum_value', 0.0)),
-                'max_score': float(result.get('max_value', 0.0)),
-                'max_category': result.get('max_key', ''),
-                'category_scores': category_scores,
-                'is_flagged': bool(result.get('is_flagged', False))
-            }
-            
-            # Log processed results
-            print("\nProcessed Results:")
-            print("-" * 30)
-            print(json.dumps(processed_result, indent=2))
-            print("="*50)
-            
-            return processed_result
-            
+            result = await self.batcher.submit(text)
         except Exception as e:
-            print(f"Error analyzing text: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
-            # Return safe default on error
-            return {
+            if isinstance(e, CircuitOpenError):
+                # Failing fast while the backend is down; the breaker already logged the transition
+                source = 'degraded'
+            else:
+                logger.exception("Error analyzing text")
+                source = 'error'
+            # Return safe default on error (never cached), marked so callers can tell it apart
+            return source, {
                 'overall_score': 0.0,
                 'max_score': 0.0,
                 'max_category': '',
                 'category_scores': {},
-                'is_flagged': False
+                'is_flagged': False,
+                'degraded': True
             }
+        
+        self.verdict_cache.put(text, result)
+        return 'backend', result
+
+    async def analyze_message(self, message):
+        """Analyze a message's content, embeds and text attachments, splitting long text into segments
+
+        Returns (source, result) like analyze_text; a segmented message reports the costliest source of its segments.
+        """
+        if not message.embeds and not message.attachments and len(message.content) <= self.chunk_max_chars:
+            return await self.analyze_text(message.content)
+        
+        sources = await message_sources(message, self.attachment_max_bytes, self.attachment_max_count) or [('message', '')]
+        segments = [
+            (source, start, segment)
+            for source, text in sources
+            for start, segment in split_segments(text, self.chunk_max_chars, self.chunk_overlap)
+        ]
+        if len(segments) > self.max_segments:
+            self.skipped.inc('segments_truncated')
+            segments = segments[:self.max_segments]
+        
+        # Segments go through the usual pre-filter, cache and coalescer concurrently
+        analyzed = await asyncio.gather(*(self.analyze_text(segment) for _, _, segment in segments))
+        if len(analyzed) == 1:
+            return analyzed[0]
+        source = max((source for source, _ in analyzed), key=VERDICT_SOURCES.index)
+        return source, merge_results([(*segment, result) for segment, (_, result) in zip(segments, analyzed)])
+
+    async def _score_text(self, text):
+        """Analyze text using the Gradio API for toxicity detection"""
+        logger.debug("Toxicity analysis request: %r", text, extra={'sampled': True})
+        
+        # Call Gradio API
+        start = time.perf_counter()
+        try:
+            result = await self.backend.predict(
+                text,                    # Message to analyze
+                0.5,                     # Backend threshold (only sets its is_flagged; channel policies decide)
+                "/fetch_toxicity_level", # API endpoint
+                api_name="/fetch_toxicity_level"
+            )
+        except CircuitOpenError:
+            # Rejected without a call, so no latency to record
+            self.backend_calls.inc('rejected')
+            raise
+        except (asyncio.TimeoutError, TimeoutError):
+            self.backend_calls.inc('timeout')
+            self.backend_latency.observe(time.perf_counter() - start)
+            raise
+        except Exception:
+            self.backend_calls.inc('error')
+            self.backend_latency.observe(time.perf_counter() - start)
+            raise
+        self.backend_calls.inc('success')
+        self.backend_latency.observe(time.perf_counter() - start)
+        
+        # Handle tuple response from API
+        if isinstance(result, tuple) and len(result) > 1:
+            result = result[1]  # Extract JSON response
+        
+        # Parse string response if needed
+        if isinstance(result, str):
+            result = json.loads(result)
+            
+        # Log raw API response
+        logger.debug("API response: %s", result, extra={'sampled': True})
+        
+        # Extract category scores
+        category_scores = {}
+        for key, value in result.items():
+            if isinstance(value, (int, float)) and key not in [
+                'safer_value', 'sum_value', 'max_value', 
+                'is_flagged', 'is_safer_flagged'
+            ]:
+                category_scores[key] = float(value)
+        
+        # Process results
+        processed_result = {
+            'overall_score': float(result.get('sum_value', 0.0)),
+            'max_score': float(result.get('max_value', 0.0)),
+            'max_category': result.get('max_key', ''),
+            'category_scores': category_scores,
+            'is_flagged': bool(result.get('is_flagged', False))
+        }
+        
+        # Log processed results
+        logger.debug("Processed result: %s", processed_result, extra={'sampled': True})
+        
+        return processed_result
 
     async def on_message(self, message):
-        """Process incoming messages for toxicity"""
+        """Queue incoming messages from monitored channels for toxicity scoring"""
         # Ignore our own messages
         if message.author == self.user:
             return
@@ -393,80 +936,259 @@ class ToxicityBot(commands.Bot):
         # Rest of message handling (only for monitored channels)
         try:
             # Skip if not in a monitored channel or if it's a command
-            if (message.channel.id not in self.analyzing_channels or 
-                message.content.startswith(self.command_prefix)):
+            if message.channel.id not in self.analyzing_channels:
+                self.skipped.inc('not_monitored')
+                return
+            if message.content.startswith(self.command_prefix):
+                self.skipped.inc('command')
                 return
             
-            # Check message age - ignore messages older than 30 seconds
+            # Check message age - ignore messages older than the cutoff
             message_age = (discord.utils.utcnow() - message.created_at).total_seconds()
-            if message_age > 30:
+            if message_age > self.max_message_age:
+                self.skipped.inc('too_old')
+                return
+            
+            # Copies of a message already being scored wait for its verdict instead (attachments are
+            # scored per message, so only plain text messages are grouped)
+            guild_id = message.guild.id if message.guild else 0
+            if message.content and not message.attachments and self.bursts.observe(guild_id, message):
+                self.skipped.inc('burst_duplicate')
+                return
+            
+            self._enqueue_message(message)
+        except Exception:
+            logger.exception("Error in on_message")
+
+    async def on_message_edit(self, before, after):
+        """Rescore edited messages in monitored channels once the edits settle"""
+        if after.author == self.user:
+            return
+        try:
+            if after.channel.id not in self.analyzing_channels:
+                return
+            if after.content.startswith(self.command_prefix):
+                self.skipped.inc('command')
+                return
+            # Embed unfurls and pins also arrive as edits with unchanged content
+            if before.content == after.content:
+                self.skipped.inc('edit_unchanged')
+                return
+            self.edits.add(before.content, after)
+        except Exception:
+            logger.exception("Error in on_message_edit")
+
+    def _enqueue_message(self, message, edited=False):
+        """Hand a new or edited message to the scoring workers; returns True if it was queued"""
+        # Prevent duplicate processing (adding also expires keys older than 60 seconds)
+        message_key = (message.channel.id, message.id)
+        if message_key in self.message_cooldown:
+            if edited:
+                # The worker may already have read the old content: re-check once it finishes
+                self.deferred_edits[message_key] = message
+                self.skipped.inc('edit_deferred')
+            else:
+                self.skipped.inc('duplicate')
+            return False
+        
+        self.message_cooldown.add(message_key)
+        
+        # Hand off to the scoring workers; a full queue sheds by policy
+        guild_id = message.guild.id if message.guild else 0
+        shed = self.scoring_queue.put(guild_id, message.channel.id, message)
+        if shed is not None:
+            self.skipped.inc('shed')
+            self.message_cooldown.discard((shed.channel.id, shed.id))
+        return shed is not message
+
+    async def _process_message(self, message):
+        """Score a queued message and alert on toxic content (runs in a scoring worker)"""
+        message_key = (message.channel.id, message.id)
+        scored_content = None
+        try:
+            # Skip channels that stopped being monitored while the message waited
+            if message.channel.id not in self.analyzing_channels:
+                self.skipped.inc('channel_stopped')
                 return
             
-            # Prevent duplicate processing
-            message_key = f"{message.channel.id}:{message.id}"
-            if message_key in self.message_cooldown:
+            # Drop messages that aged past the cutoff while queued (edits count from the last edit)
+            posted_at = message.edited_at or message.created_at
+            message_age = (discord.utils.utcnow() - posted_at).total_seconds()
+            if message_age > self.max_message_age:
+                self.skipped.inc('expired_in_queue')
                 return
             
-            self.message_cooldown[message_key] = time.time()
+            # Get toxicity analysis, then apply the channel's policy to the raw category scores
+            policy = self.policy_for(message.channel.id)
+            scored_content = message.content
+            source, raw_result = await self.analyze_message(message)
+            result = policy.evaluate(raw_result)
+            self.verdicts.inc(source)
+            guild_id = message.guild.id if message.guild else 0
+            if not raw_result.get('degraded'):
+                # Copies of this message held by the burst detector reuse this verdict
+                self.bursts.set_verdict(guild_id, message, raw_result)
+            self.verdict_latency.observe((discord.utils.utcnow() - posted_at).total_seconds())
             
-            # Process the message for toxicity
-            try:
-                # Clean up old cooldowns (older than 60 seconds)
-                current_time = time.time()
-                stale_keys = [
-                    k for k, v in self.message_cooldown.items() 
-                    if current_time - v > 60
-                ]
-                for k in stale_keys:
-                    self.message_cooldown.pop(k, None)
-                
-                # Get toxicity analysis
-                result = await self.analyze_text(message.content)
-                
-                # Only respond to toxic messages
-                if result['is_flagged']:
-                    # Create clickable link to the message
-                    message_link = f"https://discord.com/channels/{message.guild.id}/{message.channel.id}/{message.id}"
-                    
-                    # Format category scores above 20%
-                    significant_categories = []
-                    for category, score in result['category_scores'].items():
-                        if score > 0.2:  # 20% threshold
-                            significant_categories.append(f"{category}: {score:.1%}")
-                    
-                    significant_categories.sort(reverse=True)
-                    categories_text = "\n".join(significant_categories[:5])
-                    
-                    # Create response message
-                    response = (
-                        f"⚠️ **Toxic Message Detected**\n"
-                        f"Overall Score: {result['overall_score']:.2f}\n"
-                        f"Highest Category: {result['max_category']} ({result['max_score']:.1%})\n\n"
-                        f"**Significant Categories:**\n{categories_text}\n\n"
-                        f"[View Message]({message_link})"
-                    )
-                    
-                    # Create and send embed
-                    embed = discord.Embed(
-                        title="Toxicity Alert",
-                        description=response,
-                        color=discord.Color.red()
-                    )
-                    embed.set_footer(text=f"Message from {message.author.name}")
-                    
-                    await message.channel.send(embed=embed)
-            except Exception as e:
-                print(f"Error in message handling: {str(e)}")
-                import traceback
-                print(traceback.format_exc())
-        except Exception as e:
-            print(f"Error in on_message: {str(e)}")
-            import traceback
-            print(traceback.format_exc())
+            # Track the author's rolling history (defaults from a failed backend call say nothing about them)
+            escalate = False
+            if not result.get('degraded'):
+                escalate = self.offenders.record(guild_id, message.author.id, result)
+            
+            # Only respond to toxic messages
+            if result['is_flagged']:
+                self.flagged.inc(result['max_category'] or 'unknown')
+                self.audit_log.record(message, result, 'escalated' if escalate else 'alert')
+                await self._send_alert(message, result, policy, escalate)
+        except Exception:
+            logger.exception("Error in message handling")
         finally:
             # Clean up cooldown entry
-            if 'message_key' in locals() and message_key in self.message_cooldown:
-                self.message_cooldown.pop(message_key)
+            self.message_cooldown.discard(message_key)
+            
+            # Queue an edit that settled while this message was in flight, unless its content was what got scored
+            edited = self.deferred_edits.pop(message_key, None)
+            if edited is not None and edited.content != scored_content and self._enqueue_message(edited, edited=True):
+                self.edits.stats['rescored'] += 1
+
+    def _on_burst(self, cluster):
+        """Fan a burst's verdict out to its copies once its window closes"""
+        task = asyncio.create_task(self._handle_burst(cluster))
+        self.burst_tasks.add(task)
+        task.add_done_callback(self.burst_tasks.discard)
+
+    async def _handle_burst(self, cluster):
+        """Apply the representative's verdict to every copy and send one raid alert for large bursts"""
+        try:
+            messages = [m for m in cluster.duplicates if m.channel.id in self.analyzing_channels]
+            if not messages:
+                return
+            # The representative's worker normally stored its verdict already; score it here only if the
+            # window closed first (analyze_message, so long messages are segmented the same way)
+            result = cluster.verdict
+            if result is None:
+                _, result = await self.analyze_message(cluster.representative)
+            if result.get('degraded'):
+                self.skipped.inc('burst_degraded')
+                return
+            
+            async def copy_verdict(message):
+                policy = self.policy_for(message.channel.id)
+                verdict = policy.evaluate(result)
+                if verdict['is_flagged'] or cache_key(message.content) == cluster.exact:
+                    self.verdicts.inc('burst')
+                    return message, policy, verdict
+                # A near-duplicate only inherits a flag: the words it changed could make it toxic
+                source, own_result = await self.analyze_message(message)
+                self.verdicts.inc(source)
+                return message, policy, policy.evaluate(own_result)
+            
+            flagged = []
+            for message, policy, verdict in await asyncio.gather(*(copy_verdict(m) for m in messages)):
+                if verdict.get('degraded'):
+                    self.skipped.inc('burst_degraded')
+                    continue
+                # Copies wait for the window to close, so their latency includes it
+                self.verdict_latency.observe((discord.utils.utcnow() - message.created_at).total_seconds())
+                escalate = self.offenders.record(cluster.guild_id, message.author.id, verdict)
+                if verdict['is_flagged']:
+                    self.flagged.inc(verdict['max_category'] or 'unknown')
+                    flagged.append((message, verdict, policy, escalate))
+            if not flagged:
+                return
+            
+            # Small bursts get regular alerts; a raid gets one alert listing every flagged copy
+            representative = cluster.representative
+            representative_flagged = (
+                representative.channel.id in self.analyzing_channels
+                and self.policy_for(representative.channel.id).evaluate(result)['is_flagged']
+            )
+            flagged_copies = len(flagged) + representative_flagged
+            is_raid = flagged_copies >= self.raid_min_messages
+            for message, verdict, _, escalate in flagged:
+                outcome = 'raid' if is_raid else 'escalated' if escalate else 'burst'
+                self.audit_log.record(message, verdict, outcome)
+            if not is_raid:
+                for message, verdict, policy, escalate in flagged:
+                    await self._send_alert(message, verdict, policy, escalate)
+                return
+            
+            alert_channel = representative.channel if representative_flagged else flagged[0][0].channel
+            authors = {message.author.id for message, _, _, _ in flagged}
+            if representative_flagged:
+                authors.add(representative.author.id)
+            links = "\n".join(
+                f"[{message.author.name}](https://discord.com/channels/{message.guild.id}/{message.channel.id}/{message.id})"
+                f"{' 🚨 repeat offender' if escalate else ''}"
+                for message, _, _, escalate in flagged
+            )
+            verdict = flagged[0][1]
+            embed = discord.Embed(
+                title="🚨 Raid Detected",
+                description=(
+                    f"{flagged_copies} copies of a flagged message from {len(authors)} accounts in "
+                    f"{self.bursts.window:g}s.\n"
+                    f"Highest Category: {verdict['max_category']} ({verdict['max_score']:.1%})\n\n"
+                    f"**Copies:**\n{links}"
+                )[:4096],
+                color=discord.Color.dark_red()
+            )
+            embed.set_footer(text=f"First posted by {representative.author.name}")
+            await self.send_with_rate_limit(alert_channel, embed=embed)
+        except Exception:
+            logger.exception("Error handling message burst")
+
+    async def _send_alert(self, message, result, policy, escalate=False):
+        """Send the alert for one flagged message in the channel policy's format"""
+        # Create clickable link to the message
+        message_link = f"https://discord.com/channels/{message.guild.id}/{message.channel.id}/{message.id}"
+        
+        # Create response message
+        if policy.alert_format == 'compact':
+            response = (
+                f"⚠️ {result['max_category']} ({result['max_score']:.1%}) "
+                f"[View Message]({message_link})"
+            )
+        else:
+            categories_text = "\n".join(f"{category}: {score:.1%}" for category, score in result['significant'])
+            # Name the segment that triggered the flag for long messages and attachments
+            segment = triggering_segment(result, result['max_category'])
+            trigger_text = ""
+            if segment is not None:
+                trigger_text = (
+                    f"**Triggered by:** {segment['source']} (chars {segment['start']}-{segment['end']})\n"
+                    f"> {discord.utils.escape_markdown(segment['excerpt'])}\n\n"
+                )
+            response = (
+                f"⚠️ **Toxic Message Detected**\n"
+                f"Overall Score: {result['overall_score']:.2f}\n"
+                f"Highest Category: {result['max_category']} ({result['max_score']:.1%})\n\n"
+                f"**Significant Categories:**\n{categories_text}\n\n"
+                f"{trigger_text}"
+                f"[View Message]({message_link})"
+            )
+        
+        # Create and send embed (escalated for repeat offenders)
+        if escalate:
+            guild_id = message.guild.id if message.guild else 0
+            recent = self.offenders.recent_flags(guild_id, message.author.id, self.offenders.escalate_window)
+            embed = discord.Embed(
+                title="🚨 Repeat Offender Alert",
+                description=(
+                    f"{message.author.mention} has been flagged {recent} times in the last "
+                    f"{self.offenders.escalate_window / 60:g} minutes.\n\n{response}"
+                ),
+                color=discord.Color.dark_red()
+            )
+        else:
+            embed = discord.Embed(
+                title="Toxicity Alert",
+                description=response,
+                color=discord.Color.red()
+            )
+        embed.set_footer(text=f"Message from {message.author.name}{' (edited)' if message.edited_at else ''}")
+        
+        await self.send_with_rate_limit(message.channel, embed=embed)
 
     # Add an error handler for command errors
     @commands.Cog.listener()
@@ -483,10 +1205,29 @@ class ToxicityBot(commands.Bot):
         # Notify the user of the error
         await ctx.send(f"❌ An error occurred: {str(error)}")
 
-# Create bot instance
-bot = ToxicityBot()
-
 if __name__ == "__main__":
+    # Sharding options are passed by supervisor.py; a plain `python bot.py` runs every shard
+    parser = argparse.ArgumentParser(description="Discord toxicity analysis bot")
+    parser.add_argument('--worker-id', type=int, default=None, help='Worker index assigned by supervisor.py')
+    parser.add_argument('--shard-ids', default=None, help='Comma-separated shard ids owned by this process')
+    parser.add_argument('--shard-count', type=int, default=None, help='Total shards across all workers')
+    args = parser.parse_args()
+    shard_ids = [int(shard) for shard in args.shard_ids.split(',')] if args.shard_ids else None
+    
+    if args.worker_id is None:
+        # Replace any running instance via the lock file (the supervisor holds it for workers)
+        print("\n=== Checking for existing bot instances ===")
+        instance_lock = SingleInstanceLock(os.getenv('BOT_LOCK_FILE', 'bot.lock'))
+        try:
+            instance_lock.acquire()
+        except AlreadyRunningError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print("=== Starting new bot instance ===\n")
+    
+    # Create bot instance
+    bot = ToxicityBot(shard_ids=shard_ids, shard_count=args.shard_count, worker_id=args.worker_id)
+    
     # Configure root logger
     logging.basicConfig(
         level=logging.INFO,
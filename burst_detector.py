@@ -0,0 +1,155 @@
+import asyncio
+import hashlib
+import re
+
+from verdict_cache import cache_key, normalize_text
+
+_WORDS = re.compile(r'\w+')
+
+
+def simhash(text):
+    """64-bit SimHash of the character 4-grams of a text's words (punctuation and case ignored)"""
+    text = ' '.join(_WORDS.findall(normalize_text(text)))
+    # One 64-character bit string per shingle; each output bit is the majority vote of its column
+    hashes = [
+        format(int.from_bytes(hashlib.blake2b(text[i:i + 4].encode('utf-8'), digest_size=8).digest(), 'big'), '064b')
+        for i in range(max(1, len(text) - 3))
+    ]
+    half = len(hashes) / 2
+    return int(''.join('1' if column.count('1') > half else '0' for column in zip(*hashes)), 2)
+
+
+class MessageCluster:
+    """A representative message plus the copies of it posted during the burst window"""
+
+    __slots__ = ('guild_id', 'representative', 'duplicates', 'exact', 'fingerprint', 'verdict', 'timer')
+
+    def __init__(self, guild_id, representative, exact, fingerprint):
+        self.guild_id = guild_id
+        self.representative = representative
+        self.duplicates = []
+        self.exact = exact
+        self.fingerprint = fingerprint
+        self.verdict = None               # The representative's unprocessed verdict, once it has been scored
+        self.timer = None
+
+
+class BurstDetector:
+    """Collapse same and near-same messages posted in a guild within a short window
+
+    The first message of a burst is scored normally; later copies are held in
+    its cluster and handed to on_close together when the window ends, so a raid
+    costs one backend call however many accounts join it. Near-duplicates must
+    also be within max_length_ratio of the representative's length, so a copy
+    with words appended is scored on its own.
+    """
+
+    def __init__(self, on_close, window=10.0, max_distance=4, min_length=20, max_length_ratio=0.1,
+                 max_clusters=1000):
+        self.on_close = on_close                  # Called with each cluster that collected duplicates
+        self.window = window                      # Seconds a cluster stays open after its first message
+        self.max_distance = max_distance          # Largest SimHash Hamming distance counted as a copy
+        self.min_length = min_length              # Shorter messages only match exactly
+        self.max_length_ratio = max_length_ratio  # Largest length difference of a near-duplicate, as a fraction
+        self.max_clusters = max_clusters          # Open clusters per guild before detection pauses
+
+        # Split fingerprints into max_distance + 1 bands: two within max_distance bits share at least one
+        self._band_bits = 64 // (max_distance + 1)
+
+        self._exact = {}                  # guild_id -> {cache key: cluster}
+        self._bands = {}                  # guild_id -> {(band index, band value): [clusters]}
+
+        self.stats = {
+            'clusters': 0,
+            'duplicates': 0,
+            'bursts': 0,
+        }
+
+    def __len__(self):
+        return sum(len(exact_index) for exact_index in self._exact.values())
+
+    def observe(self, guild_id, message):
+        """Record a message; returns True if it was absorbed as a copy of an open cluster"""
+        exact = cache_key(message.content)
+        exact_index = self._exact.setdefault(guild_id, {})
+        cluster = exact_index.get(exact)
+
+        fingerprint = None
+        if cluster is None and len(message.content) >= self.min_length:
+            fingerprint = simhash(message.content)
+            cluster = self._near(guild_id, fingerprint, len(message.content))
+
+        if cluster is not None:
+            if message.id == cluster.representative.id:
+                return True  # Redelivered event for the message being scored
+            cluster.duplicates.append(message)
+            self.stats['duplicates'] += 1
+            return True
+
+        if len(exact_index) >= self.max_clusters:
+            return False
+
+        # First of its kind: open a cluster with this message as representative
+        cluster = MessageCluster(guild_id, message, exact, fingerprint)
+        exact_index[exact] = cluster
+        if fingerprint is not None:
+            bands = self._bands.setdefault(guild_id, {})
+            for band in self._band_keys(fingerprint):
+                bands.setdefault(band, []).append(cluster)
+        cluster.timer = asyncio.get_running_loop().call_later(self.window, self._close, cluster)
+        self.stats['clusters'] += 1
+        return False
+
+    def _band_keys(self, fingerprint):
+        mask = (1 << self._band_bits) - 1
+        return [(i, fingerprint >> (self._band_bits * i) & mask) for i in range(self.max_distance + 1)]
+
+    def _near(self, guild_id, fingerprint, length):
+        """Open cluster within max_distance and of similar length; any such cluster shares at least one band"""
+        bands = self._bands.get(guild_id)
+        if not bands:
+            return None
+        for band in self._band_keys(fingerprint):
+            for cluster in bands.get(band, ()):
+                other = len(cluster.representative.content)
+                if (abs(length - other) <= self.max_length_ratio * max(length, other)
+                        and bin(cluster.fingerprint ^ fingerprint).count('1') <= self.max_distance):
+                    return cluster
+        return None
+
+    def set_verdict(self, guild_id, message, result):
+        """Keep a representative's verdict on its open cluster so the copies reuse it"""
+        cluster = self._exact.get(guild_id, {}).get(cache_key(message.content))
+        if cluster is not None and cluster.representative.id == message.id:
+            cluster.verdict = result
+
+    def _close(self, cluster):
+        self._remove(cluster)
+        if cluster.duplicates:
+            self.stats['bursts'] += 1
+            self.on_close(cluster)
+
+    def _remove(self, cluster):
+        exact_index = self._exact.get(cluster.guild_id, {})
+        if exact_index.get(cluster.exact) is cluster:
+            del exact_index[cluster.exact]
+        if not exact_index:
+            self._exact.pop(cluster.guild_id, None)
+
+        if cluster.fingerprint is not None:
+            bands = self._bands.get(cluster.guild_id, {})
+            for band in self._band_keys(cluster.fingerprint):
+                clusters = bands.get(band)
+                if clusters is not None:
+                    clusters.remove(cluster)
+                    if not clusters:
+                        del bands[band]
+            if not bands:
+                self._bands.pop(cluster.guild_id, None)
+
+    def clear(self):
+        """Cancel every open cluster without reporting it"""
+        for exact_index in list(self._exact.values()):
+            for cluster in list(exact_index.values()):
+                cluster.timer.cancel()
+                self._remove(cluster)
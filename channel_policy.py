@@ -0,0 +1,77 @@
+ALERT_FORMATS = ('full', 'compact')
+
+
+class ChannelPolicy:
+    """Per-channel flagging rules, evaluated locally against a verdict's raw category scores"""
+
+    def __init__(self, threshold=0.5, category_thresholds=None, ignored=(),
+                 report_threshold=0.2, top_n=5, alert_format='full'):
+        for value in (threshold, report_threshold, *(category_thresholds or {}).values()):
+            if not 0.0 <= value <= 1.0:
+                raise ValueError(f"Thresholds must be between 0 and 1, got {value}")
+        if alert_format not in ALERT_FORMATS:
+            raise ValueError(f"Alert format must be one of {', '.join(ALERT_FORMATS)}")
+        if top_n < 1:
+            raise ValueError("top_n must be at least 1")
+
+        self.threshold = float(threshold)            # Flag when a category reaches this score
+        self.category_thresholds = {name: float(value) for name, value in (category_thresholds or {}).items()}
+        self.ignored = frozenset(ignored)            # Categories that never flag or show in alerts
+        self.report_threshold = float(report_threshold)  # Categories listed in alerts
+        self.top_n = int(top_n)
+        self.alert_format = alert_format
+
+    @classmethod
+    def from_config(cls, config):
+        """Build the policy stored in a channel store config, or the default one"""
+        return cls(**((config or {}).get('policy') or {}))
+
+    def to_dict(self):
+        return {
+            'threshold': self.threshold,
+            'category_thresholds': dict(self.category_thresholds),
+            'ignored': sorted(self.ignored),
+            'report_threshold': self.report_threshold,
+            'top_n': self.top_n,
+            'alert_format': self.alert_format,
+        }
+
+    def replace(self, **changes):
+        """Return a validated copy with some settings changed"""
+        return ChannelPolicy(**{**self.to_dict(), **changes})
+
+    def evaluate(self, result):
+        """Return a copy of a verdict with is_flagged, max_category and max_score decided by this policy
+
+        Also adds 'significant': up to top_n (category, score) pairs above the
+        report threshold, highest first.
+        """
+        scores = sorted(
+            ((score, category) for category, score in result['category_scores'].items()
+             if category not in self.ignored),
+            reverse=True
+        )
+        max_score, max_category = scores[0] if scores else (0.0, '')
+        return {
+            **result,
+            'is_flagged': any(
+                score >= self.category_thresholds.get(category, self.threshold) for score, category in scores
+            ),
+            'max_score': max_score,
+            'max_category': max_category,
+            'significant': [
+                (category, score) for score, category in scores[:self.top_n] if score > self.report_threshold
+            ],
+        }
+
+    def describe(self):
+        """Human-readable summary for the !policy command"""
+        lines = [
+            f"**Flag threshold:** {self.threshold:.0%}",
+            "**Category thresholds:** " + (", ".join(
+                f"{name} {value:.0%}" for name, value in sorted(self.category_thresholds.items())
+            ) or "none"),
+            f"**Ignored categories:** {', '.join(sorted(self.ignored)) or 'none'}",
+            f"**Alert format:** {self.alert_format} (top {self.top_n} categories above {self.report_threshold:.0%})",
+        ]
+        return "\n".join(lines)
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger('discord_bot')
+
+
+class ChannelStore:
+    """Monitored channels and their configuration, persisted to SQLite in debounced background batches"""
+
+    def __init__(self, path='channel_state.db', debounce=1.0, legacy_json='analyzing_channels.json'):
+        self.path = path
+        self.debounce = debounce      # Seconds to wait for more changes before writing
+        self.channels = {}            # channel_id -> config dict (authoritative in memory)
+
+        self._dirty = set()           # channel ids changed since the last write
+        self._changed = asyncio.Event()
+        self._task = None
+        self._write_lock = threading.Lock()
+
+        # WAL keeps readers unblocked and makes each batch commit atomic
+        self._db = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS channels ("
+            "channel_id INTEGER PRIMARY KEY, config TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS scan_checkpoints ("
+            "channel_id INTEGER PRIMARY KEY, checkpoint TEXT NOT NULL)"
+        )
+        self._db.commit()
+        self._load(legacy_json)
+
+    def _load(self, legacy_json):
+        """Load saved channels, importing the old JSON file on first run"""
+        for channel_id, config in self._db.execute("SELECT channel_id, config FROM channels"):
+            self.channels[channel_id] = json.loads(config)
+
+        imported = self._db.execute("SELECT 1 FROM meta WHERE key = 'legacy_imported'").fetchone()
+        if imported or not legacy_json:
+            return
+        try:
+            with open(legacy_json, 'r') as f:
+                legacy = json.load(f) or []
+        except FileNotFoundError:
+            legacy = []
+        except Exception:
+            logger.exception("Error importing %s", legacy_json)
+            return
+
+        for channel_id in legacy:
+            self.channels[int(channel_id)] = {}
+        self._write({channel_id: {} for channel_id in self.channels}, ())
+        with self._db:
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('legacy_imported', ?)", (legacy_json,))
+        if legacy:
+            logger.info("Imported %d channels from %s", len(legacy), legacy_json)
+
+    def __contains__(self, channel_id):
+        return channel_id in self.channels
+
+    def __iter__(self):
+        return iter(self.channels)
+
+    def __len__(self):
+        return len(self.channels)
+
+    def add(self, channel_id, config=None):
+        self.channels[channel_id] = dict(config or {})
+        self._mark(channel_id)
+
+    def remove(self, channel_id):
+        if self.channels.pop(channel_id, None) is not None:
+            self._mark(channel_id)
+
+    def get_config(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def update_config(self, channel_id, **changes):
+        """Merge changes into a monitored channel's configuration"""
+        self.channels[channel_id].update(changes)
+        self._mark(channel_id)
+
+    def _mark(self, channel_id):
+        self._dirty.add(channel_id)
+        self._changed.set()
+
+    def start(self):
+        """Start the background writer on the running loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await self._changed.wait()
+            # Debounce: let a burst of changes land in one write
+            await asyncio.sleep(self.debounce)
+            self._changed.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write every pending change in a single transaction off the event loop"""
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        upserts = {cid: dict(self.channels[cid]) for cid in dirty if cid in self.channels}
+        deletes = [cid for cid in dirty if cid not in self.channels]
+        try:
+            await asyncio.to_thread(self._write, upserts, deletes)
+        except Exception:
+            logger.exception("Error saving channel state")
+            self._dirty |= dirty  # Retry on the next flush
+            self._changed.set()
+
+    def _write(self, upserts, deletes):
+        with self._write_lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO channels (channel_id, config) VALUES (?, ?)",
+                [(cid, json.dumps(config)) for cid, config in upserts.items()]
+            )
+            self._db.executemany("DELETE FROM channels WHERE channel_id = ?", [(cid,) for cid in deletes])
+
+    async def load_checkpoint(self, channel_id):
+        """Return the saved !scan checkpoint for a channel, or None"""
+        row = await asyncio.to_thread(self._read_checkpoint, channel_id)
+        return json.loads(row[0]) if row else None
+
+    def _read_checkpoint(self, channel_id):
+        with self._write_lock:
+            return self._db.execute(
+                "SELECT checkpoint FROM scan_checkpoints WHERE channel_id = ?", (channel_id,)
+            ).fetchone()
+
+    async def save_checkpoint(self, channel_id, checkpoint):
+        """Write a !scan checkpoint atomically; None clears it"""
+        await asyncio.to_thread(self._write_checkpoint, channel_id, None if checkpoint is None else json.dumps(checkpoint))
+
+    def _write_checkpoint(self, channel_id, checkpoint):
+        with self._write_lock, self._db:
+            if checkpoint is None:
+                self._db.execute("DELETE FROM scan_checkpoints WHERE channel_id = ?", (channel_id,))
+            else:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO scan_checkpoints (channel_id, checkpoint) VALUES (?, ?)",
+                    (channel_id, checkpoint)
+                )
+
+    async def close(self):
+        """Stop the writer, flush what is pending and close the database"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        self._db.close()
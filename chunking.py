@@ -0,0 +1,104 @@
+import logging
+
+logger = logging.getLogger('discord_bot')
+
+MEDIA_EMBED_TYPES = ('image', 'video', 'gifv')  # Previews with no text worth scoring
+TEXT_EXTENSIONS = ('.txt', '.md', '.log', '.csv', '.json', '.py', '.js', '.html', '.xml', '.yaml', '.yml')
+
+
+def split_segments(text, max_chars=512, overlap=64):
+    """Split text into overlapping [(start, segment)] of at most max_chars, breaking at whitespace when possible"""
+    if len(text) <= max_chars:
+        return [(0, text)]
+    segments = []
+    start = 0
+    while start < len(text):
+        end = min(start + max_chars, len(text))
+        if end < len(text):
+            # Prefer ending on a word boundary in the second half of the window
+            space = text.rfind(' ', start + max_chars // 2, end)
+            if space != -1:
+                end = space
+        segments.append((start, text[start:end]))
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return segments
+
+
+def embed_text(embed):
+    """Text a user can put in an embed: title, description and fields"""
+    parts = [embed.title or '', embed.description or '']
+    for field in embed.fields:
+        parts.extend((field.name or '', field.value or ''))
+    return "\n".join(part for part in parts if part)
+
+
+def is_text_attachment(attachment):
+    content_type = (attachment.content_type or '').split(';')[0]
+    return content_type.startswith('text/') or attachment.filename.lower().endswith(TEXT_EXTENSIONS)
+
+
+async def message_sources(message, max_attachment_bytes=8192, max_attachments=3):
+    """[(source label, text)] for a message's content, embeds and small text attachments"""
+    sources = [('message', message.content)] if message.content else []
+    for i, embed in enumerate(message.embeds):
+        if embed.type in MEDIA_EMBED_TYPES:
+            continue
+        text = embed_text(embed)
+        if text:
+            sources.append((f'embed {i + 1}', text))
+
+    attachments = [a for a in message.attachments if is_text_attachment(a)][:max_attachments]
+    for attachment in attachments:
+        # The size cap is checked before downloading so memory stays bounded
+        if attachment.size > max_attachment_bytes:
+            continue
+        try:
+            data = await attachment.read()
+        except Exception:
+            logger.exception("Error reading attachment %s", attachment.filename)
+            continue
+        sources.append((attachment.filename, data[:max_attachment_bytes].decode('utf-8', errors='replace')))
+    return sources
+
+
+def merge_results(scored):
+    """Combine [(source, start, segment, result)] into one verdict: max per category, flagged if any segment is
+
+    The merged verdict keeps a 'segments' list so alerts can name the segment
+    that triggered a category.
+    """
+    category_scores = {}
+    segments = []
+    for source, start, segment, result in scored:
+        for category, score in result['category_scores'].items():
+            category_scores[category] = max(category_scores.get(category, 0.0), score)
+        segments.append({
+            'source': source,
+            'start': start,
+            'end': start + len(segment),
+            'excerpt': segment[:100],
+            'category_scores': result['category_scores'],
+        })
+
+    top = max((result for _, _, _, result in scored), key=lambda result: result['max_score'])
+    merged = {
+        'overall_score': max(result['overall_score'] for _, _, _, result in scored),
+        'max_score': top['max_score'],
+        'max_category': top['max_category'],
+        'category_scores': category_scores,
+        'is_flagged': any(result['is_flagged'] for _, _, _, result in scored),
+        'segments': segments,
+    }
+    if any(result.get('degraded') for _, _, _, result in scored):
+        merged['degraded'] = True
+    return merged
+
+
+def triggering_segment(result, category):
+    """The segment with the highest score for a category, or None for single-segment verdicts"""
+    segments = result.get('segments')
+    if not segments or len(segments) < 2:
+        return None
+    return max(segments, key=lambda segment: segment['category_scores'].get(category, 0.0))
@@ -0,0 +1,58 @@
+import time
+from collections import deque
+
+
+class ExpiringKeySet:
+    """Set of (channel_id, message_id) keys with O(1) amortized insert, lookup and expiry"""
+
+    def __init__(self, ttl=60.0):
+        self.ttl = ttl              # Seconds a key stays in the set
+        self._added = {}            # key -> monotonic time it was added
+        self._order = deque()       # (added_at, key) in insertion order, oldest first
+        self._by_channel = {}       # channel_id -> set of message ids
+
+    def __contains__(self, key):
+        return key in self._added
+
+    def __len__(self):
+        return len(self._added)
+
+    def add(self, key, now=None):
+        """Add a key and expire anything older than the TTL"""
+        now = time.monotonic() if now is None else now
+        self.expire(now)
+        self._added[key] = now
+        self._order.append((now, key))
+        channel_id, message_id = key
+        self._by_channel.setdefault(channel_id, set()).add(message_id)
+
+    def discard(self, key):
+        """Remove a key if present (its queue entry is skipped lazily on expiry)"""
+        if self._added.pop(key, None) is None:
+            return
+        channel_id, message_id = key
+        channel_keys = self._by_channel.get(channel_id)
+        if channel_keys is not None:
+            channel_keys.discard(message_id)
+            if not channel_keys:
+                del self._by_channel[channel_id]
+
+    def discard_channel(self, channel_id):
+        """Remove every key of one channel without touching other channels"""
+        for message_id in self._by_channel.pop(channel_id, ()):
+            self._added.pop((channel_id, message_id), None)
+
+    def expire(self, now=None):
+        """Pop keys older than the TTL from the front of the insertion order"""
+        now = time.monotonic() if now is None else now
+        cutoff = now - self.ttl
+        while self._order and self._order[0][0] <= cutoff:
+            added_at, key = self._order.popleft()
+            # Skip stale entries for keys that were discarded or re-added since
+            if self._added.get(key) == added_at:
+                self.discard(key)
+
+    def clear(self):
+        self._added.clear()
+        self._order.clear()
+        self._by_channel.clear()
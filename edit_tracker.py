@@ -0,0 +1,62 @@
+import asyncio
+import re
+
+from verdict_cache import normalize_text
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def is_trivial_edit(before, after):
+    """True if two versions differ only in case, whitespace, punctuation or markdown"""
+    return _NON_WORD.sub('', normalize_text(before)) == _NON_WORD.sub('', normalize_text(after))
+
+
+class EditCoalescer:
+    """Collapse bursts of edits to one message into a single rescore after a settle delay"""
+
+    def __init__(self, callback, settle_delay=2.0):
+        self.callback = callback          # Called with the settled message if it needs rescoring; True if queued
+        self.settle_delay = settle_delay  # Seconds without further edits before rescoring
+        self._pending = {}                # (channel_id, message_id) -> (content before the burst, latest message, timer)
+
+        self.stats = {
+            'edits': 0,
+            'coalesced': 0,
+            'trivial': 0,
+            'rescored': 0,
+        }
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, before_content, message):
+        """Record an edit, restarting the message's settle timer"""
+        self.stats['edits'] += 1
+        key = (message.channel.id, message.id)
+        pending = self._pending.get(key)
+        if pending is not None:
+            # Keep comparing against the content from before the first edit in the burst
+            self.stats['coalesced'] += 1
+            before_content = pending[0]
+            pending[2].cancel()
+        timer = asyncio.get_running_loop().call_later(self.settle_delay, self._settle, key)
+        self._pending[key] = (before_content, message, timer)
+
+    def _settle(self, key):
+        before_content, message, _ = self._pending.pop(key)
+        if is_trivial_edit(before_content, message.content):
+            self.stats['trivial'] += 1
+            return
+        # The callback returns False if the message could not be queued right now
+        if self.callback(message):
+            self.stats['rescored'] += 1
+
+    def drop_channel(self, channel_id):
+        """Forget pending edits for one channel"""
+        for key in [key for key in self._pending if key[0] == channel_id]:
+            self._pending.pop(key)[2].cancel()
+
+    def clear(self):
+        for _, _, timer in self._pending.values():
+            timer.cancel()
+        self._pending.clear()
@@ -0,0 +1,108 @@
+import datetime
+import heapq
+import re
+
+import discord
+
+_DURATION = re.compile(r'^(\d+)([mhdw])$')
+_UNITS = {'m': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+
+
+def parse_scan_target(arg, default_limit=500):
+    """Parse the !scan argument into (limit, since)
+
+    Accepts a message count (`1000`), a duration back from now (`30m`, `12h`,
+    `2d`, `1w`) or an ISO date (`2024-05-01`). Raises ValueError otherwise.
+    """
+    if arg is None:
+        return default_limit, None
+    arg = arg.strip().lower()
+    if arg.isdigit():
+        return int(arg), None
+
+    match = _DURATION.match(arg)
+    if match:
+        delta = datetime.timedelta(**{_UNITS[match.group(2)]: int(match.group(1))})
+        return None, discord.utils.utcnow() - delta
+
+    since = datetime.datetime.fromisoformat(arg)
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=datetime.timezone.utc)
+    return None, since
+
+
+async def batched(iterator, size):
+    """Group an async iterator into lists of at most `size` items"""
+    batch = []
+    async for item in iterator:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class ScanSummary:
+    """Running totals for a history scan, small enough to checkpoint after every batch"""
+
+    def __init__(self, top_n=10):
+        self.top_n = top_n
+        self.scanned = 0
+        self.flagged = 0
+        self.by_category = {}
+        self.worst = []  # Min-heap of (max_score, message_id, link, author, category)
+
+    def add(self, message, result):
+        self.scanned += 1
+        if not result['is_flagged']:
+            return
+        self.flagged += 1
+        category = result['max_category'] or 'unknown'
+        self.by_category[category] = self.by_category.get(category, 0) + 1
+
+        link = f"https://discord.com/channels/{message.guild.id}/{message.channel.id}/{message.id}"
+        entry = (result['max_score'], message.id, link, message.author.name, category)
+        if len(self.worst) < self.top_n:
+            heapq.heappush(self.worst, entry)
+        else:
+            heapq.heappushpop(self.worst, entry)
+
+    def to_dict(self):
+        return {
+            'scanned': self.scanned,
+            'flagged': self.flagged,
+            'by_category': self.by_category,
+            'worst': [list(entry) for entry in self.worst],
+        }
+
+    @classmethod
+    def from_dict(cls, data, top_n=10):
+        summary = cls(top_n)
+        summary.scanned = data['scanned']
+        summary.flagged = data['flagged']
+        summary.by_category = data['by_category']
+        summary.worst = [tuple(entry) for entry in data['worst']]
+        heapq.heapify(summary.worst)
+        return summary
+
+    def embed(self):
+        """One report embed for the whole scan"""
+        lines = [
+            f"**Messages scanned:** {self.scanned}",
+            f"**Flagged:** {self.flagged} ({self.flagged / self.scanned if self.scanned else 0.0:.1%})",
+        ]
+        if self.by_category:
+            categories = sorted(self.by_category.items(), key=lambda item: item[1], reverse=True)
+            lines.append("\n**By category:**\n" + "\n".join(f"{name}: {count}" for name, count in categories))
+        if self.worst:
+            worst = sorted(self.worst, reverse=True)
+            lines.append("\n**Most toxic messages:**\n" + "\n".join(
+                f"[{category} {score:.1%}]({link}) by {author}" for score, _, link, author, category in worst
+            ))
+
+        return discord.Embed(
+            title="🧾 History Scan Report",
+            description="\n".join(lines)[:4096],
+            color=discord.Color.orange() if self.flagged else discord.Color.green()
+        )
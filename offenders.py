@@ -0,0 +1,182 @@
+import time
+from array import array
+from collections import OrderedDict
+
+
+class UserHistory:
+    """Fixed-size ring buffers of one user's recent verdicts and flag times"""
+
+    __slots__ = ('times', 'scores', 'categories', 'flagged', 'head', 'count',
+                 'flag_times', 'flag_head', 'flag_total', 'last_seen', 'escalated_at')
+
+    def __init__(self, capacity, escalate_after):
+        self.times = array('d', bytes(8 * capacity))        # When each verdict was recorded
+        self.scores = array('f', bytes(4 * capacity))       # Highest category score of each verdict
+        self.categories = array('H', bytes(2 * capacity))   # Interned category id of that score
+        self.flagged = array('b', bytes(capacity))
+        self.head = 0                                       # Next slot to write
+        self.count = 0
+        self.flag_times = array('d', bytes(8 * escalate_after))  # Last escalate_after flag times
+        self.flag_head = 0
+        self.flag_total = 0
+        self.last_seen = 0.0
+        self.escalated_at = float('-inf')
+
+    def add(self, now, score, category_id, flagged):
+        capacity = len(self.times)
+        self.times[self.head] = now
+        self.scores[self.head] = score
+        self.categories[self.head] = category_id
+        self.flagged[self.head] = flagged
+        self.head = (self.head + 1) % capacity
+        self.count = min(self.count + 1, capacity)
+        self.last_seen = now
+        if flagged:
+            self.flag_times[self.flag_head] = now
+            self.flag_head = (self.flag_head + 1) % len(self.flag_times)
+            self.flag_total += 1
+
+    def oldest_recent_flag(self):
+        """Time of the earliest of the last escalate_after flags, or None if there are fewer"""
+        if self.flag_total < len(self.flag_times):
+            return None
+        return self.flag_times[self.flag_head]  # The slot about to be overwritten is the oldest
+
+    def events(self, since):
+        """(time, score, category_id, flagged) for verdicts recorded after since"""
+        capacity = len(self.times)
+        for i in range(self.count):
+            slot = (self.head - self.count + i) % capacity
+            if self.times[slot] >= since:
+                yield self.times[slot], self.scores[slot], self.categories[slot], self.flagged[slot]
+
+
+class OffenderTracker:
+    """Per-guild, per-user rolling toxicity aggregates with a hard memory cap and idle eviction
+
+    Recording a verdict and checking escalation are O(1); the least recently
+    active user is evicted once the memory budget is reached.
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, capacity=32, window=86400.0, idle_ttl=86400.0,
+                 half_life=3600.0, escalate_after=3, escalate_window=600.0):
+        if capacity < 1 or escalate_after < 1:
+            raise ValueError("Offender history capacity and escalate_after must be at least 1")
+        self.capacity = capacity                # Verdicts kept per user
+        self.window = window                    # Seconds covered by !offenders
+        self.idle_ttl = idle_ttl                # Users with no verdicts for this long are evicted
+        self.half_life = half_life              # Decay of scores in the aggregates
+        self.escalate_after = escalate_after    # Flags ...
+        self.escalate_window = escalate_window  # ... within this many seconds escalate an alert
+
+        self._users = OrderedDict()             # (guild_id, user_id) -> UserHistory, least recently active first
+        self._category_ids = {'': 0}
+        self._category_names = ['']
+
+        self.bytes_per_user = self._footprint()
+        self.max_users = max(1, max_bytes // self.bytes_per_user)
+        self.stats = {
+            'recorded': 0,
+            'escalations': 0,
+            'evicted': 0,
+        }
+
+    def _footprint(self):
+        """Approximate memory of one tracked user, including its dict entry"""
+        history = UserHistory(self.capacity, self.escalate_after)
+        arrays = (history.times, history.scores, history.categories, history.flagged, history.flag_times)
+        return (history.__sizeof__() + sum(a.__sizeof__() for a in arrays)
+                + 200)  # Key tuple, ints and OrderedDict link
+
+    def __len__(self):
+        return len(self._users)
+
+    def _category_id(self, name):
+        category_id = self._category_ids.get(name)
+        if category_id is None:
+            if len(self._category_names) >= 65535:
+                return 0
+            category_id = self._category_ids[name] = len(self._category_names)
+            self._category_names.append(name)
+        return category_id
+
+    def record(self, guild_id, user_id, result, now=None):
+        """Add a verdict; returns True when this flag should be escalated"""
+        now = time.time() if now is None else now
+        self.stats['recorded'] += 1
+        key = (guild_id, user_id)
+        history = self._users.get(key)
+        if history is None:
+            self._evict(now)
+            history = self._users[key] = UserHistory(self.capacity, self.escalate_after)
+        else:
+            self._users.move_to_end(key)
+
+        flagged = bool(result['is_flagged'])
+        history.add(now, result['max_score'], self._category_id(result['max_category'] or ''), flagged)
+        if not flagged:
+            return False
+
+        # Escalate once per window when the last escalate_after flags all fall inside it
+        oldest = history.oldest_recent_flag()
+        if (oldest is not None and now - oldest <= self.escalate_window
+                and now - history.escalated_at > self.escalate_window):
+            history.escalated_at = now
+            self.stats['escalations'] += 1
+            return True
+        return False
+
+    def _evict(self, now):
+        """Drop idle users from the front, then the least recently active one if still at the cap"""
+        cutoff = now - self.idle_ttl
+        while self._users:
+            key, history = next(iter(self._users.items()))
+            if history.last_seen >= cutoff and len(self._users) < self.max_users:
+                break
+            del self._users[key]
+            self.stats['evicted'] += 1
+
+    def recent_flags(self, guild_id, user_id, window, now=None):
+        """Flags recorded for a user within the last window seconds"""
+        now = time.time() if now is None else now
+        history = self._users.get((guild_id, user_id))
+        if history is None:
+            return 0
+        return sum(flagged for _, _, _, flagged in history.events(now - window))
+
+    def summary(self, history, now):
+        """Flag count and decayed max/mean score by category over the window"""
+        categories = {}
+        flags = 0
+        for at, score, category_id, flagged in history.events(now - self.window):
+            flags += flagged
+            weight = 0.5 ** ((now - at) / self.half_life)
+            entry = categories.setdefault(self._category_names[category_id], [0.0, 0.0, 0.0])
+            entry[0] = max(entry[0], score * weight)
+            entry[1] += score * weight
+            entry[2] += weight
+        return {
+            'flags': flags,
+            'categories': {
+                name: {'max': decayed_max, 'mean': total / weights if weights else 0.0}
+                for name, (decayed_max, total, weights) in categories.items() if name
+            },
+        }
+
+    def offenders(self, guild_id, limit=10, now=None):
+        """[(user_id, summary)] for a guild's users with flags in the window, most flags first"""
+        now = time.time() if now is None else now
+        ranked = []
+        for (history_guild, user_id), history in self._users.items():
+            if history_guild != guild_id or history.flag_total == 0:
+                continue
+            summary = self.summary(history, now)
+            if summary['flags']:
+                ranked.append((user_id, summary))
+        ranked.sort(key=lambda item: (
+            item[1]['flags'], max((c['max'] for c in item[1]['categories'].values()), default=0.0)
+        ), reverse=True)
+        return ranked[:limit]
+
+    def memory_bytes(self):
+        return len(self._users) * self.bytes_per_user
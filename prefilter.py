@@ -0,0 +1,134 @@
+import json
+import re
+from collections import deque
+
+from verdict_cache import normalize_text
+
+# Pre-filter verdicts
+CLEAN = 'clean'
+FLAGGED = 'flagged'
+REMOTE = 'remote'
+
+_URL = re.compile(r'https?://\S+')
+_CUSTOM_EMOJI = re.compile(r'<a?:\w+:\d+>')
+_MENTION = re.compile(r'<[@#][!&]?\d+>')
+
+
+class AhoCorasick:
+    """Compiled multi-pattern matcher that finds every pattern in a single pass"""
+
+    def __init__(self, patterns):
+        # patterns: dict of pattern -> payload
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+        for pattern, payload in patterns.items():
+            node = 0
+            for char in pattern:
+                if char not in self._goto[node]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[node][char] = len(self._goto) - 1
+                node = self._goto[node][char]
+            self._out[node].append((len(pattern), payload))
+
+        # Breadth-first pass to build failure links
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def __bool__(self):
+        return len(self._goto) > 1
+
+    def finditer(self, text):
+        """Yield (start, end, payload) for every pattern occurrence in text"""
+        node = 0
+        for i, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for length, payload in self._out[node]:
+                yield i - length + 1, i + 1, payload
+
+
+def _is_word_boundary(text, start, end):
+    """True if text[start:end] is not embedded inside a longer word"""
+    before = text[start - 1] if start > 0 else ' '
+    after = text[end] if end < len(text) else ' '
+    return not before.isalnum() and not after.isalnum()
+
+
+class PreFilter:
+    """Local first stage that settles obviously clean or obviously toxic messages without a remote call"""
+
+    def __init__(self, flagged_terms=None, whitelist=None, min_length=3):
+        # flagged_terms: dict of term -> category reported in the verdict
+        self.flagged_terms = {normalize_text(t): c for t, c in (flagged_terms or {}).items()}
+        self.whitelist = {normalize_text(p) for p in (whitelist or [])}
+        self.min_length = min_length  # Messages shorter than this (after cleanup) are clean
+        self.matcher = AhoCorasick(self.flagged_terms)
+
+        # How many remote calls the tier saved, by reason
+        self.stats = {
+            'remote': 0,
+            'flagged_lexicon': 0,
+            'clean_whitelist': 0,
+            'clean_url_only': 0,
+            'clean_emoji_only': 0,
+            'clean_short': 0,
+        }
+
+    @classmethod
+    def from_file(cls, path, min_length=3):
+        """Build a pre-filter from a JSON lexicon file, or an empty one if it is missing"""
+        try:
+            with open(path, 'r') as f:
+                lexicon = json.load(f)
+        except FileNotFoundError:
+            print(f"No pre-filter lexicon found at {path}. Using heuristics only.")
+            lexicon = {}
+        return cls(lexicon.get('flagged', {}), lexicon.get('whitelist', []), min_length)
+
+    def classify(self, text):
+        """Return (verdict, reason, category) for text"""
+        normalized = normalize_text(text)
+
+        # Lexicon hits win over every clean heuristic
+        if self.matcher:
+            for start, end, category in self.matcher.finditer(normalized):
+                if _is_word_boundary(normalized, start, end):
+                    self.stats['flagged_lexicon'] += 1
+                    return FLAGGED, 'flagged_lexicon', category
+
+        if normalized in self.whitelist:
+            self.stats['clean_whitelist'] += 1
+            return CLEAN, 'clean_whitelist', None
+
+        if _URL.search(normalized) and not _URL.sub('', normalized).strip():
+            self.stats['clean_url_only'] += 1
+            return CLEAN, 'clean_url_only', None
+
+        stripped = _MENTION.sub('', _CUSTOM_EMOJI.sub('', normalized))
+        if normalized and not any(c.isalnum() for c in stripped):
+            self.stats['clean_emoji_only'] += 1
+            return CLEAN, 'clean_emoji_only', None
+
+        if len(stripped.replace(' ', '')) < self.min_length:
+            self.stats['clean_short'] += 1
+            return CLEAN, 'clean_short', None
+
+        self.stats['remote'] += 1
+        return REMOTE, 'remote', None
+
+    def calls_saved(self):
+        """Number of messages settled locally instead of by the backend"""
+        return sum(v for k, v in self.stats.items() if k != 'remote')
@@ -0,0 +1,143 @@
+import asyncio
+import logging
+import random
+from collections import OrderedDict, deque
+
+# Shedding policies applied when the queue is full
+DROP_OLDEST = 'drop_oldest'  # Drop the oldest message of the busiest guild
+DROP_NEWEST = 'drop_newest'  # Reject the incoming message
+SAMPLE = 'sample'            # Admit a random sample of incoming messages, dropping the busiest guild's oldest
+
+SHED_POLICIES = (DROP_OLDEST, DROP_NEWEST, SAMPLE)
+
+logger = logging.getLogger('discord_bot')
+
+
+class FairScoringQueue:
+    """Bounded queue served round-robin across guilds, then across channels within a guild"""
+
+    def __init__(self, capacity=1000, policy=DROP_OLDEST, sample_rate=0.1):
+        if policy not in SHED_POLICIES:
+            raise ValueError(f"Unknown shedding policy: {policy}")
+        self.capacity = capacity
+        self.policy = policy
+        self.sample_rate = sample_rate  # Fraction of incoming messages admitted under SAMPLE
+
+        self._guilds = OrderedDict()    # guild_id -> OrderedDict(channel_id -> deque of items)
+        self._guild_sizes = {}          # guild_id -> queued items
+        self._size = 0
+        self._not_empty = asyncio.Event()
+
+        self.stats = {
+            'enqueued': 0,
+            'shed': 0,
+        }
+
+    def __len__(self):
+        return self._size
+
+    def put(self, guild_id, channel_id, item):
+        """Queue an item, returning whichever item was shed (or None)"""
+        shed = None
+        if self._size >= self.capacity:
+            if self.policy == DROP_NEWEST:
+                self.stats['shed'] += 1
+                return item
+            if self.policy == SAMPLE and random.random() >= self.sample_rate:
+                self.stats['shed'] += 1
+                return item
+            shed = self._pop_busiest()
+            self.stats['shed'] += 1
+
+        channels = self._guilds.setdefault(guild_id, OrderedDict())
+        channels.setdefault(channel_id, deque()).append(item)
+        self._guild_sizes[guild_id] = self._guild_sizes.get(guild_id, 0) + 1
+        self._size += 1
+        self.stats['enqueued'] += 1
+        self._not_empty.set()
+        return shed
+
+    async def get(self):
+        """Wait for and return the next item in round-robin order"""
+        while not self._size:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+
+        # Take from the guild at the head, then rotate it to the back
+        guild_id, channels = next(iter(self._guilds.items()))
+        channel_id, items = next(iter(channels.items()))
+        item = items.popleft()
+        self._remove_one(guild_id, channel_id, items, channels)
+        if channel_id in channels:
+            channels.move_to_end(channel_id)
+        if guild_id in self._guilds:
+            self._guilds.move_to_end(guild_id)
+        return item
+
+    def drop_channel(self, channel_id):
+        """Discard everything queued for a channel, returning the dropped items"""
+        for guild_id, channels in list(self._guilds.items()):
+            items = channels.get(channel_id)
+            if items is None:
+                continue
+            dropped = list(items)
+            items.clear()
+            del channels[channel_id]
+            self._guild_sizes[guild_id] -= len(dropped)
+            self._size -= len(dropped)
+            if not channels:
+                del self._guilds[guild_id]
+                del self._guild_sizes[guild_id]
+            return dropped
+        return []
+
+    def _pop_busiest(self):
+        """Remove the oldest item of the guild with the most queued work"""
+        guild_id = max(self._guild_sizes, key=self._guild_sizes.get)
+        channels = self._guilds[guild_id]
+        channel_id = max(channels, key=lambda c: len(channels[c]))
+        items = channels[channel_id]
+        item = items.popleft()
+        self._remove_one(guild_id, channel_id, items, channels)
+        return item
+
+    def _remove_one(self, guild_id, channel_id, items, channels):
+        """Update bookkeeping after one item left a channel's deque"""
+        self._size -= 1
+        self._guild_sizes[guild_id] -= 1
+        if not items:
+            del channels[channel_id]
+        if not channels:
+            del self._guilds[guild_id]
+            del self._guild_sizes[guild_id]
+
+
+class ScoringWorkerPool:
+    """Fixed pool of worker tasks draining a FairScoringQueue"""
+
+    def __init__(self, queue, handler, workers=8):
+        self.queue = queue
+        self.handler = handler  # Coroutine function called with each queued item
+        self.workers = workers
+        self._tasks = []
+
+    def start(self):
+        """Spawn the worker tasks on the running loop"""
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Cancel the workers and wait for them to exit"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _work(self):
+        while True:
+            item = await self.queue.get()
+            try:
+                await self.handler(item)
+            except Exception:
+                logger.exception("Error in scoring worker")
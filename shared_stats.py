@@ -0,0 +1,79 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger('discord_bot')
+
+
+class SharedStats:
+    """Per-worker stats snapshots in a SQLite file every worker process can read"""
+
+    def __init__(self, path='shared_stats.db', worker_id='0', interval=10.0):
+        self.path = path
+        self.worker_id = str(worker_id)
+        self.interval = interval      # Seconds between snapshots
+        self._task = None
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS worker_stats ("
+            "worker_id TEXT PRIMARY KEY, updated_at REAL NOT NULL, stats TEXT NOT NULL)"
+        )
+        self._db.commit()
+
+    def start(self, snapshot):
+        """Publish snapshot() every interval from a background task"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(snapshot))
+
+    async def _run(self, snapshot):
+        while True:
+            try:
+                await self.publish(snapshot())
+            except Exception:
+                logger.exception("Error publishing shared stats")
+            await asyncio.sleep(self.interval)
+
+    async def publish(self, stats):
+        await asyncio.to_thread(self._write, json.dumps(stats))
+
+    def _write(self, stats):
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO worker_stats (worker_id, updated_at, stats) VALUES (?, ?, ?)",
+                (self.worker_id, time.time(), stats)
+            )
+
+    async def read_all(self, max_age=None):
+        """Return {worker_id: stats} for workers that reported within max_age seconds"""
+        return await asyncio.to_thread(self._read, max_age if max_age is not None else self.interval * 3)
+
+    def _read(self, max_age):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT worker_id, stats FROM worker_stats WHERE updated_at >= ?",
+                (time.time() - max_age,)
+            ).fetchall()
+        return {worker_id: json.loads(stats) for worker_id, stats in rows}
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._db.close()
+
+
+def combine(snapshots):
+    """Sum numeric stats across workers"""
+    totals = {}
+    for stats in snapshots.values():
+        for key, value in stats.items():
+            if isinstance(value, (int, float)):
+                totals[key] = totals.get(key, 0) + value
+    return totals
@@ -0,0 +1,57 @@
+import fcntl
+import os
+import signal
+import time
+
+
+class AlreadyRunningError(Exception):
+    """Raised when another process holds the instance lock"""
+
+
+class SingleInstanceLock:
+    """PID lock file enforcing one running instance; the OS releases it if the process dies"""
+
+    def __init__(self, path='bot.lock'):
+        self.path = path
+        self._file = None
+
+    def acquire(self, replace=True, timeout=30.0):
+        """Take the lock, asking the current holder to shut down first if replace is set"""
+        self._file = open(self.path, 'a+')
+        deadline = time.monotonic() + timeout
+        signalled = False
+        while True:
+            try:
+                fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                pid = self._holder_pid()
+                if not replace:
+                    raise AlreadyRunningError(f"Another instance is running (PID {pid})")
+                if not signalled and pid:
+                    print(f"Stopping existing bot instance with PID: {pid}")
+                    try:
+                        os.kill(pid, signal.SIGTERM)
+                    except ProcessLookupError:
+                        pass
+                    signalled = True
+                if time.monotonic() > deadline:
+                    raise AlreadyRunningError(f"Instance with PID {pid} did not exit within {timeout:.0f}s")
+                time.sleep(0.2)
+
+        # Record our PID for the next instance
+        self._file.seek(0)
+        self._file.truncate()
+        self._file.write(str(os.getpid()))
+        self._file.flush()
+
+    def _holder_pid(self):
+        self._file.seek(0)
+        content = self._file.read().strip()
+        return int(content) if content.isdigit() else None
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
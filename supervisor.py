@@ -0,0 +1,109 @@
+"""Run the bot as several sharded worker processes
+
+Each worker runs bot.py with its own subset of gateway shards. Workers share
+the channel store, verdict cache and stats through local SQLite files, and
+crashed workers are restarted with backoff.
+
+    python supervisor.py --workers 4 --shard-count 8
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from singleton import SingleInstanceLock, AlreadyRunningError
+
+BOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot.py')
+
+
+def shard_assignment(workers, shard_count):
+    """Spread shards round-robin across workers: worker i gets shards i, i + workers, ..."""
+    return [list(range(i, shard_count, workers)) for i in range(workers)]
+
+
+def spawn_worker(worker_id, shard_ids, shard_count):
+    """Start one bot.py worker process"""
+    env = dict(os.environ)
+    # Every worker needs its own metrics port
+    if env.get('METRICS_PORT'):
+        env['METRICS_PORT'] = str(int(env['METRICS_PORT']) + worker_id)
+    command = [
+        sys.executable, BOT_PATH,
+        '--worker-id', str(worker_id),
+        '--shard-ids', ','.join(str(shard) for shard in shard_ids),
+        '--shard-count', str(shard_count),
+    ]
+    print(f"Starting worker {worker_id} with shards {shard_ids}")
+    return subprocess.Popen(command, env=env)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Number of worker processes')
+    parser.add_argument('--shard-count', type=int, default=None, help='Total gateway shards (default: one per worker)')
+    parser.add_argument('--max-backoff', type=float, default=60.0, help='Longest wait before restarting a crashed worker')
+    args = parser.parse_args()
+
+    shard_count = args.shard_count or args.workers
+    workers = min(args.workers, shard_count)
+    assignment = shard_assignment(workers, shard_count)
+
+    # Replace any running instance via the lock file; workers run under this lock
+    print("\n=== Checking for existing bot instances ===")
+    instance_lock = SingleInstanceLock(os.getenv('BOT_LOCK_FILE', 'bot.lock'))
+    try:
+        instance_lock.acquire()
+    except AlreadyRunningError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"=== Starting {workers} workers for {shard_count} shards ===\n")
+
+    processes = {i: spawn_worker(i, assignment[i], shard_count) for i in range(workers)}
+    started_at = {i: time.monotonic() for i in range(workers)}
+    backoff = {i: 1.0 for i in range(workers)}
+    restart_at = {}
+    stopping = False
+
+    def shutdown(sig, frame):
+        nonlocal stopping
+        print("\nShutdown signal received. Stopping workers...")
+        stopping = True
+        for process in processes.values():
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    # Restart crashed workers until asked to stop
+    while not stopping:
+        now = time.monotonic()
+        for worker_id, process in processes.items():
+            code = process.poll()
+            if code is None:
+                continue
+            if worker_id not in restart_at:
+                # A worker that ran for a while before exiting starts over with a short backoff
+                if now - started_at[worker_id] > args.max_backoff:
+                    backoff[worker_id] = 1.0
+                print(f"Worker {worker_id} exited with code {code}; restarting in {backoff[worker_id]:.0f}s")
+                restart_at[worker_id] = now + backoff[worker_id]
+                backoff[worker_id] = min(backoff[worker_id] * 2, args.max_backoff)
+            elif now >= restart_at[worker_id]:
+                del restart_at[worker_id]
+                processes[worker_id] = spawn_worker(worker_id, assignment[worker_id], shard_count)
+                started_at[worker_id] = now
+        time.sleep(1.0)
+
+    for process in processes.values():
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    print("=== All workers stopped ===")
+
+
+if __name__ == '__main__':
+    main()
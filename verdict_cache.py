@@ -0,0 +1,180 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger('discord_bot')
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    """Case-fold text and collapse runs of whitespace"""
+    return _WHITESPACE.sub(' ', text.casefold()).strip()
+
+
+def cache_key(text):
+    """Content address for a message: hash of its normalized text"""
+    return hashlib.sha1(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+class VerdictCache:
+    """Bounded LRU/TTL cache of processed analyze_text results, optionally backed by SQLite"""
+
+    def __init__(self, max_entries=10000, ttl=3600.0, path=None, flush_every=64, flush_interval=5.0, shared=False):
+        self.max_entries = max_entries  # Hard cap on in-memory entries
+        self.ttl = ttl                  # Seconds before a verdict is considered stale
+        self.path = path                # SQLite file, or None for memory only
+        self.flush_every = flush_every  # Write early once this many entries are dirty
+        self.flush_interval = flush_interval  # Seconds between background writes
+        self.shared = shared            # Consult the file on memory misses (other processes write to it too)
+
+        self._entries = OrderedDict()   # key -> (stored_at, result), oldest first
+        self._dirty = {}                # Entries not yet written to disk
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._full = asyncio.Event()
+        self._task = None
+
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.path:
+            self._open()
+
+    def _open(self):
+        """Open the SQLite file and warm the in-memory cache from it"""
+        self._db = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+        # WAL lets several bot processes read and write the same file
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            "key TEXT PRIMARY KEY, stored_at REAL NOT NULL, result TEXT NOT NULL)"
+        )
+        cutoff = time.time() - self.ttl
+        self._db.execute("DELETE FROM verdicts WHERE stored_at < ?", (cutoff,))
+        self._db.commit()
+
+        # Load the most recent entries so the LRU order matches age
+        rows = self._db.execute(
+            "SELECT key, stored_at, result FROM verdicts ORDER BY stored_at DESC LIMIT ?",
+            (self.max_entries,)
+        ).fetchall()
+        for key, stored_at, result in reversed(rows):
+            self._entries[key] = (stored_at, json.loads(result))
+
+    async def get(self, text):
+        """Return a cached result for text, or None on a miss (shared lookups run off the event loop)"""
+        key = cache_key(text)
+        entry = self._entries.get(key)
+        if entry is None and self.shared and self._db is not None:
+            try:
+                entry = await self._load_shared(key)
+            except Exception:
+                logger.exception("Error reading shared verdict cache")
+        if entry is None:
+            self.misses += 1
+            return None
+
+        stored_at, result = entry
+        if time.time() - stored_at > self.ttl:
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return json.loads(json.dumps(result))  # Callers get their own copy
+
+    async def _load_shared(self, key):
+        """Look a key up in the shared file and promote it into memory"""
+        row = await asyncio.to_thread(self._read, key)
+        if row is None:
+            return None
+        entry = (row[0], json.loads(row[1]))
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        self.shared_hits += 1
+        return entry
+
+    def _read(self, key):
+        with self._db_lock:
+            return self._db.execute("SELECT stored_at, result FROM verdicts WHERE key = ?", (key,)).fetchone()
+
+    def put(self, text, result):
+        """Store a processed result for text"""
+        key = cache_key(text)
+        entry = (time.time(), result)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+        if self._db is not None:
+            self._dirty[key] = entry
+            if len(self._dirty) >= self.flush_every:
+                self._full.set()
+
+    def start(self):
+        """Start the background writer on the running loop"""
+        if self._db is not None and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write pending entries to disk in one transaction off the event loop"""
+        if self._db is None or not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        rows = [(key, stored_at, json.dumps(result)) for key, (stored_at, result) in dirty.items()]
+        try:
+            await asyncio.to_thread(self._write, rows)
+        except Exception:
+            logger.exception("Error writing verdict cache")
+            self._dirty = {**dirty, **self._dirty}  # Retry on the next flush
+
+    def _write(self, rows):
+        with self._db_lock, self._db:
+            self._db.executemany("INSERT OR REPLACE INTO verdicts (key, stored_at, result) VALUES (?, ?, ?)", rows)
+
+    async def close(self):
+        """Stop the writer, flush and close the backing file"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._db is not None:
+            await self.flush()
+            self._db.close()
+            self._db = None
+
+    def stats(self):
+        """Counters for sizing the cache"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }